@@ -0,0 +1,245 @@
+import weakref
+
+import numpy
+
+# *************************************************************************************************
+#
+#       ###    ##    ## #### ##     ##    ###    ######## ####  #######  ##    ##  ######  ########  #######  ########  ########
+#      ## ##   ###   ##  ##  ###   ###   ## ##      ##     ##  ##     ## ###   ## ##    ##    ##    ##     ## ##     ## ##
+#     ##   ##  ####  ##  ##  #### ####  ##   ##     ##     ##  ##     ## ####  ## ##          ##    ##     ## ##     ## ##
+#    ##     ## ## ## ##  ##  ## ### ## ##     ##    ##     ##  ##     ## ## ## ##  ######     ##    ##     ## ########  ######
+#    ######### ##  ####  ##  ##     ## #########    ##     ##  ##     ## ##  ####       ##    ##    ##     ## ##   ##   ##
+#    ##     ## ##   ###  ##  ##     ## ##     ##    ##     ##  ##     ## ##   ### ##    ##    ##    ##     ## ##    ##  ##
+#    ##     ## ##    ## #### ##     ## ##     ##    ##    ####  #######  ##    ##  ######     ##     #######  ##     ## ########
+#
+# **************************************************************************************************
+
+
+EASE_LINEAR = 0
+EASE_IN_OUT = 1
+
+
+def ease_in_out(progress):
+    # smoothstep, starts and finishes at rest
+    return progress * progress * (3 - 2 * progress)
+
+
+class AnimationStore:
+    """
+    Holds the state of every Adjustable as a set of parallel NumPy arrays (one slot per
+    Adjustable) so that all of them can be advanced together with a handful of array
+    operations per frame, rather than one Python call per property per sprite.
+    Each slot stores where its value came from and when, rather than a per-frame step, and
+    the value is worked out from the clock (in seconds) whenever the store is stepped.
+    A slot is either tweening (origin to target over duration, with an easing) or moving
+    at a speed (origin + velocity * t + accel * t^2 / 2 for the first accel_time seconds,
+    steady after that) until it reaches its target. Dropped or merged frames therefore
+    never change how long anything takes.
+    Only slots with somewhere to go are advanced: setting a target or a speed wakes a slot
+    up and it goes back to sleep when it arrives (or is slowed to a stop before getting
+    there), so idle values cost nothing per frame.
+    Owners are told when their values change (invalidate) and keep a count of their
+    values that are awake (active_adjustables).
+    """
+
+    def __init__(self, capacity=256):
+        self.size = 0  # slots in use are all below this
+        self.free_slots = []
+        self.handles = []
+        self.owners = []
+        self.active = set()
+        self.active_slots = None  # sorted array of the active set, rebuilt when it changes
+        self.allocate_arrays(capacity)
+
+    def allocate_arrays(self, capacity):
+        old_size = len(self.handles)
+        for name, dtype in [("current", numpy.float64), ("target", numpy.float64),
+                            ("origin", numpy.float64), ("start_time", numpy.float64),
+                            ("duration", numpy.float64), ("velocity", numpy.float64),
+                            ("accel", numpy.float64), ("accel_time", numpy.float64),
+                            ("lower", numpy.float64), ("upper", numpy.float64),
+                            ("frozen_at", numpy.float64), ("easing", numpy.int8),
+                            ("changed", bool), ("frozen", bool)]:
+            array = numpy.zeros(capacity, dtype=dtype)
+            if old_size > 0:
+                array[:old_size] = getattr(self, name)[:old_size]
+            setattr(self, name, array)
+        self.handles += [None] * (capacity - old_size)
+        self.owners += [None] * (capacity - old_size)
+
+    def allocate(self, handle, value, lower, upper):
+        if len(self.free_slots) > 0:
+            slot = self.free_slots.pop()
+        else:
+            if self.size >= len(self.handles):
+                self.allocate_arrays(len(self.handles) * 2)
+            slot = self.size
+            self.size += 1
+        self.current[slot] = value
+        self.target[slot] = value
+        self.origin[slot] = value
+        self.lower[slot] = lower
+        self.upper[slot] = upper
+        for name in ["start_time", "duration", "velocity", "accel", "accel_time", "frozen_at"]:
+            getattr(self, name)[slot] = 0.0
+        self.easing[slot] = EASE_LINEAR
+        self.changed[slot] = False
+        self.frozen[slot] = False
+        self.handles[slot] = weakref.ref(handle)
+        self.owners[slot] = None if handle.owner is None else weakref.ref(handle.owner)
+        return slot
+
+    def release(self, slot):
+        self.sleep(slot)
+        self.handles[slot] = None
+        self.owners[slot] = None
+        self.free_slots.append(slot)
+
+    def owner(self, slot):
+        return None if self.owners[slot] is None else self.owners[slot]()
+
+    def wake(self, slot):
+        if slot not in self.active:
+            self.active.add(slot)
+            self.active_slots = None
+            owner = self.owner(slot)
+            if owner is not None:
+                owner.active_adjustables += 1
+
+    def sleep(self, slot):
+        if slot in self.active:
+            self.active.discard(slot)
+            self.active_slots = None
+            owner = self.owner(slot)
+            if owner is not None:
+                owner.active_adjustables -= 1
+
+    def is_busy(self):
+        """
+        True if any value is still on its way somewhere (frozen ones are not going anywhere)
+        """
+        return any(not self.frozen[slot] for slot in self.active)
+
+    def tween(self, slot, target, seconds, now, easing=EASE_LINEAR):
+        """
+        Go from the current value to target over the given number of seconds
+        """
+        self.wake(slot)
+        self.changed[slot] = True
+        self.target[slot] = target
+        if seconds is None or seconds < 0.001:
+            self.current[slot] = target
+            self.set_origin(slot, target, now)
+            return
+        self.set_origin(slot, self.current[slot], now)
+        self.duration[slot] = seconds
+        self.easing[slot] = easing
+        if easing == EASE_LINEAR:
+            # a linear tween is just a steady speed, which set_speed can pick up from
+            self.velocity[slot] = (target - self.current[slot]) / seconds
+
+    def set_speed(self, slot, velocity, rate, now):
+        """
+        Head for the target at velocity units per second, getting there from the current
+        speed over rate seconds if rate is non-zero
+        """
+        speed = self.speed(slot, now)
+        self.wake(slot)
+        self.set_origin(slot, self.current[slot], now)
+        if rate <= 0:
+            self.velocity[slot] = velocity
+        else:
+            self.velocity[slot] = speed
+            self.accel[slot] = (velocity - speed) / rate
+            self.accel_time[slot] = rate
+        self.changed[slot] = True
+
+    def set_origin(self, slot, value, now):
+        # restart the slot from value at a steady speed of nothing
+        self.origin[slot] = value
+        self.start_time[slot] = now
+        self.frozen_at[slot] = now
+        self.duration[slot] = 0.0
+        self.easing[slot] = EASE_LINEAR
+        self.velocity[slot] = 0.0
+        self.accel[slot] = 0.0
+        self.accel_time[slot] = 0.0
+
+    def speed(self, slot, now):
+        """
+        Rate of change in units per second at the given time
+        """
+        if slot not in self.active:
+            return 0.0
+        if self.frozen[slot]:
+            now = self.frozen_at[slot]
+        elapsed = now - self.start_time[slot]
+        if self.easing[slot] == EASE_IN_OUT:
+            progress = min(1.0, max(0.0, elapsed / self.duration[slot]))
+            change = self.target[slot] - self.origin[slot]
+            return float(change * 6 * progress * (1 - progress) / self.duration[slot])
+        return float(self.velocity[slot] + self.accel[slot] * min(elapsed, self.accel_time[slot]))
+
+    def freeze(self, slot, frozen, now):
+        if frozen == self.frozen[slot]:
+            return
+        if frozen:
+            self.frozen_at[slot] = now
+        else:
+            # carry on from where it stopped, as if no time had passed
+            self.start_time[slot] += now - self.frozen_at[slot]
+        self.frozen[slot] = frozen
+
+    def step(self, now):
+        """
+        Work out the value of every active slot at time now (in seconds), then tell the
+        owners of the ones that changed
+        """
+        if len(self.active) == 0:
+            return
+        if self.active_slots is None:
+            self.active_slots = numpy.array(sorted(self.active), dtype=numpy.intp)
+        slots = self.active_slots
+        live = ~self.frozen[slots]
+        slots = slots[live]
+        if len(slots) == 0:
+            return
+        previous = self.current[slots]
+        origin = self.origin[slots]
+        target = self.target[slots]
+        elapsed = numpy.maximum(now - self.start_time[slots], 0.0)
+        # moving at a speed, accelerating for the first accel_time seconds
+        accelerating = numpy.minimum(elapsed, self.accel_time[slots])
+        velocity = self.velocity[slots]
+        accel = self.accel[slots]
+        value = (origin + velocity * accelerating + 0.5 * accel * accelerating * accelerating
+                 + (velocity + accel * accelerating) * (elapsed - accelerating))
+        change = target - origin
+        arrived = (change == 0) | ((value - target) * change >= 0)
+        # eased tweens are a fraction of the way there
+        eased = self.easing[slots] == EASE_IN_OUT
+        if eased.any():
+            progress = numpy.minimum(elapsed[eased] / self.duration[slots][eased], 1.0)
+            value[eased] = origin[eased] + change[eased] * ease_in_out(progress)
+            arrived[eased] = progress >= 1.0
+        numpy.copyto(value, target, where=arrived)
+        # slowed to a standstill short of the target, nothing more will happen until a new speed
+        stalled = ~arrived & ~eased & (elapsed >= self.accel_time[slots]) & \
+            (numpy.abs(velocity + accel * self.accel_time[slots]) < 1e-9)
+        self.current[slots] = value
+        changed = self.changed[slots] | (value != previous)
+        changed_slots = slots[changed]
+        self.changed[changed_slots] = False
+        for slot in changed_slots:
+            owner = self.owner(slot)
+            handle = self.handles[slot]()
+            if owner is not None and handle is not None:
+                owner.invalidate(handle)
+        # anything that has arrived can go back to sleep
+        for slot in slots[arrived]:
+            self.set_origin(slot, self.target[slot], now)
+            self.sleep(slot)
+        # the target is kept, so set_speed can get them going again
+        for slot in slots[stalled]:
+            self.set_origin(slot, self.current[slot], now)
+            self.sleep(slot)
@@ -3,21 +3,56 @@ import sys, getopt
 
 def parse_args(data):
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "fh:w:d:", ["fullscreen", "height=", "width=",
-                                                               "dir", "help"])
+        opts, args = getopt.getopt(sys.argv[1:], "fiph:w:d:c:r:e:",
+                                   ["fullscreen", "idle", "profile", "height=", "width=", "dir", "help",
+                                    "cache=", "renderer=", "framerate=", "clock=", "speed=", "start=",
+                                    "export=", "format=", "length=", "atlas=", "premultiplied", "resources="])
     except getopt.GetoptError:
-        print('main.py [-f --fullscreen] [-h num] [-w num] [--width=num] [--height=num] [-d dir] '
-              '--dir=dir')
+        print('main.py [-f --fullscreen] [-i --idle] [-p --profile] [-h num] [-w num] [--width=num] [--height=num] '
+              '[-d dir] --dir=dir [-c MB] [--cache=MB] [-r full|dirty] [--renderer=full|dirty] [--framerate=fps] '
+              '[--clock=real|scaled|stepped] [--speed=num] [--start=hh:mm:ss] '
+              '[-e path] [--export=path] [--format=png|raw|video] [--length=secs] [--atlas=degrees] [--premultiplied] '
+              '[--resources=MB]')
         sys.exit(2)
     for opt, arg in opts:
         if opt in ['-f', '--fullscreen']:
             data.options['fullscreen'] = True
+        elif opt in ['-i', '--idle']:
+            data.options['idle'] = True
+        elif opt in ['-p', '--profile']:
+            data.options['profile'] = True
         elif opt in ['-h', '--height']:
             data.options['height'] = arg
         elif opt in ['-w', '--width']:
             data.options['width'] = arg
         elif opt in ['-d', '--dir']:
             data.options['dir'] = arg
+        elif opt in ['-c', '--cache']:
+            data.options['cache'] = int(arg)
+        elif opt in ['-r', '--renderer']:
+            data.options['renderer'] = arg
+        elif opt in ['--framerate']:
+            data.options['framerate'] = int(arg)
+        elif opt in ['--clock']:
+            data.options['clock'] = arg
+        elif opt in ['--speed']:
+            # implies a scaled clock
+            data.options['speed'] = float(arg)
+            data.options['clock'] = 'scaled'
+        elif opt in ['--start']:
+            data.options['start'] = arg
+        elif opt in ['-e', '--export']:
+            data.options['export'] = arg
+        elif opt in ['--format']:
+            data.options['format'] = arg
+        elif opt in ['--length']:
+            data.options['length'] = float(arg)
+        elif opt in ['--atlas']:
+            data.options['atlas'] = float(arg)
+        elif opt in ['--premultiplied']:
+            data.options['premultiplied'] = True
+        elif opt in ['--resources']:
+            data.options['resources'] = int(arg)
         elif opt in ['--help']:
             data.options['help'] = True
     data.options['args'] = args
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# standard libraries
+import os, sys, getopt, gc, glob, json, platform
+from time import perf_counter
+
+# no window or sound card needed, set before pygame is imported
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy
+import pygame
+
+# local modules
+import globals, sprites, timing
+import main
+from defaults import *
+from surfacepool import SurfacePool
+
+PHASES = ["handle_events", "do_actions", "display", "blit_flip", "frame"]
+DEMOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "demos")
+
+
+def usage():
+    print('bench.py [-s secs] [--seconds=secs] [-d dir] [--dir=dir] [-r full|dirty] [--renderer=full|dirty] '
+          '[--framerate=fps] [--clock=stepped|real] [--start=hh:mm:ss] [--atlas=degrees] [--premultiplied] '
+          '[--resources=MB] [-o file] [--output=file]')
+    print('Runs each script folder (all the demos if no -d) without a window and reports frame times as JSON')
+    print('The clock is stepped one frame at a time, so seconds are script time and runs go as fast as they can')
+
+
+def parse_args():
+    settings = {"seconds": 10, "dirs": [], "output": None, "options": {"clock": "stepped"}}
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "s:d:r:o:", ["seconds=", "dir=", "renderer=",
+                                                            "framerate=", "clock=", "start=",
+                                                            "atlas=", "premultiplied", "resources=", "output=",
+                                                            "help"])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ['-s', '--seconds']:
+            settings["seconds"] = float(arg)
+        elif opt in ['-d', '--dir']:
+            settings["dirs"].append(arg)
+        elif opt in ['-r', '--renderer']:
+            settings["options"]["renderer"] = arg
+        elif opt in ['--framerate']:
+            settings["options"]["framerate"] = int(arg)
+        elif opt in ['--clock']:
+            settings["options"]["clock"] = arg
+        elif opt in ['--start']:
+            settings["options"]["start"] = arg
+        elif opt in ['--atlas']:
+            settings["options"]["atlas"] = float(arg)
+        elif opt in ['--premultiplied']:
+            settings["options"]["premultiplied"] = True
+        elif opt in ['--resources']:
+            settings["options"]["resources"] = int(arg)
+        elif opt in ['-o', '--output']:
+            settings["output"] = arg
+        elif opt in ['--help']:
+            usage()
+            sys.exit(0)
+    if len(settings["dirs"]) == 0:
+        settings["dirs"] = sorted(folder for folder in glob.glob(os.path.join(DEMOS, "*"))
+                                  if os.path.isfile(os.path.join(folder, DEFAULT_FILENAME)))
+    return settings
+
+
+def summarise(times):
+    """
+    Frame times (in seconds) as mean and percentiles in milliseconds
+    """
+    millis = numpy.array(times) * 1000
+    if len(millis) == 0:
+        return {"mean": None, "p50": None, "p95": None, "p99": None}
+    return {"mean": round(float(millis.mean()), 3),
+            "p50": round(float(numpy.percentile(millis, 50)), 3),
+            "p95": round(float(numpy.percentile(millis, 95)), 3),
+            "p99": round(float(numpy.percentile(millis, 99)), 3)}
+
+
+def run(folder, seconds, options):
+    """
+    Run the script in folder for the given number of (clock) seconds, one frame at a time just
+    like main() does, timing each part of every frame
+    """
+    data = globals.Globals()
+    data.options.update(options)
+    data.options["dir"] = folder
+    times = {phase: [] for phase in PHASES}
+    frame_count = int(seconds * data.options["framerate"])
+    finished = "time"
+    # pool statistics for this script only
+    sprites.SpriteItem.surface_pool = SurfacePool(SURFACE_POOL_MB * 1024 * 1024, SURFACE_POOL_QUANTUM)
+    try:
+        main.set_clock(data)
+        screen, window = main.setup(data)
+        clock = pygame.time.Clock()
+        for frame in range(frame_count):
+            start = perf_counter()
+            main.handle_events(data, pygame.event.get())
+            events_done = perf_counter()
+            main.do_actions(data, timing.Timer.millis())
+            actions_done = perf_counter()
+            # waiting for the next frame is not part of the frame time
+            main.wait_for_frame(data, clock)
+            display_start = perf_counter()
+            rect_list = main.render_frame(data, window)
+            display_done = perf_counter()
+            main.show_frame(screen, window, rect_list)
+            shown = perf_counter()
+            times["handle_events"].append(events_done - start)
+            times["do_actions"].append(actions_done - events_done)
+            times["display"].append(display_done - display_start)
+            times["blit_flip"].append(shown - display_done)
+            times["frame"].append((actions_done - start) + (shown - display_start))
+    except SystemExit:
+        # the script ran an exit command
+        finished = "exit"
+    result = {"script": os.path.basename(os.path.normpath(folder)),
+              "frames": len(times["frame"]), "finished": finished,
+              "width": data.options["width"], "height": data.options["height"],
+              "framerate": data.options["framerate"], "renderer": data.options["renderer"],
+              "clock": data.options["clock"], "surface_pool": sprites.SpriteItem.surface_pool.stats(),
+              "resources": data.images.stats(),
+              "phases": {phase: summarise(phase_times) for phase, phase_times in times.items()}}
+    # don't let one script's sprites and rendered surfaces slow down the next
+    sprites.SpriteItem.render_cache.clear()
+    sprites.SpriteItem.surface_pool.clear()
+    del data
+    gc.collect()
+    return result
+
+
+def bench():
+    settings = parse_args()
+    results = {"python": platform.python_version(), "pygame": pygame.version.ver,
+               "seconds": settings["seconds"], "scripts": []}
+    for folder in settings["dirs"]:
+        results["scripts"].append(run(folder, settings["seconds"], settings["options"]))
+    report = json.dumps(results, indent=2)
+    if settings["output"] is None:
+        print(report)
+    else:
+        with open(settings["output"], "w") as file:
+            file.write(report + "\n")
+
+
+if __name__ == "__main__":
+    bench()
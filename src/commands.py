@@ -6,6 +6,7 @@ import os, re
 import pygame.mixer
 
 import params, images, sprites, timing
+from profiler import Profiler
 from defaults import *
 
 
@@ -129,27 +130,38 @@ class LoadCommand(Command):
         if tag is None:
             tag, ext = os.path.splitext(os.path.basename(filename))
         tag = self.scene.make_tag(tag)
-        if tag in Command.globalData.images.keys():
-            # Silent return, don't reload existing images, used unload first
-            return True
+        for resources in (Command.globalData.images, Command.globalData.sounds):
+            if tag in resources:
+                # Silent return, don't reload existing resources, used unload first.
+                # The scene is using it again though (if it has been restarted)
+                resources.acquire(tag, self.scene)
+                return True
+        # the scene loading it keeps it loaded until the scene stops, see Scene.stop
         if os.path.isdir(filename):
-            Command.globalData.images[tag] = images.ImageFolder(filename)
+            Command.globalData.images.add(tag, lambda: images.ImageFolder(filename), self.scene)
         elif filename.lower().endswith((".jpg", ".jpeg", ".png", ".svg")):
             rows = self.params.as_int("rows")
             cols = self.params.as_int("cols")
             if rows is not None and cols is not None:
-                Command.globalData.images[tag] = images.CellImage(filename, rows, cols)
+                Command.globalData.images.add(tag, lambda: images.CellImage(filename, rows, cols), self.scene)
             else:
-                Command.globalData.images[tag] = images.SimpleImage(filename)
+                Command.globalData.images.add(tag, lambda: images.SimpleImage(filename), self.scene)
+        elif filename.lower().endswith(".gif") and images.AnimatedImage.fits(filename):
+            Command.globalData.images.add(tag, lambda: images.AnimatedImage(filename), self.scene)
         elif filename.lower().endswith((".gif", ".mov", ".mp4")):
-            Command.globalData.images[tag] = images.Movie(filename)
+            Command.globalData.images.add(tag, lambda: images.Movie(filename), self.scene)
         elif filename.lower().endswith((".wav", ".ogg")):
-            Command.globalData.sounds[tag] = pygame.mixer.Sound(filename)
-            Command.globalData.sounds[tag].set_volume(0.5)
+            Command.globalData.sounds.add(tag, lambda: self.load_sound(filename), self.scene)
         else:
             print("Unrecognised resource file type: %s" % filename)
         return True  # Only run this command once
 
+    @staticmethod
+    def load_sound(filename):
+        sound = pygame.mixer.Sound(filename)
+        sound.set_volume(0.5)
+        return sound
+
 
 # *************************************************************************************************
 #
@@ -175,14 +187,12 @@ class UnloadCommand(Command):
 
     def do_process(self):
         for tag in self.params.get("tags"):
-            i_tag = self.scene.resolve_tag(tag, Command.globalData.images.keys())
-            for key in Command.globalData.images.keys():
-                if key == i_tag:
-                    del Command.globalData.images[i_tag]
-            s_tag = self.scene.resolve_tag(tag, Command.globalData.images.keys())
-            for key in Command.globalData.sounds.keys():
-                if key == s_tag:
-                    del Command.globalData.sounds[s_tag]
+            r_tag = self.scene.resolve_tag(tag, list(Command.globalData.images.keys()) +
+                                           list(Command.globalData.sounds.keys()))
+            # sprites already showing an image keep it
+            for resources in (Command.globalData.images, Command.globalData.sounds):
+                if r_tag in resources:
+                    del resources[r_tag]
         return True  # Only run this command once
 
 
@@ -213,9 +223,8 @@ class PlayCommand(Command):
             r_tag = self.scene.resolve_tag(tag, Command.globalData.sounds.keys())
             if r_tag is None:
                 continue
-            for s_tag in Command.globalData.sounds.keys():
-                if r_tag == s_tag:
-                    Command.globalData.sounds[r_tag].play()
+            if r_tag in Command.globalData.sounds:
+                Command.globalData.sounds[r_tag].play()
         return True
 
 
@@ -247,10 +256,8 @@ class VolumeCommand(Command):
         if r_tag is None:
             return True
         volume = self.params.as_int("value") / 100
-        for s_tag in Command.globalData.sounds.keys():
-            if r_tag == s_tag:
-                Command.globalData.sounds[r_tag].set_volume(volume)
-                break
+        if r_tag in Command.globalData.sounds:
+            Command.globalData.sounds[r_tag].set_volume(volume)
         return True
 
 # *************************************************************************************************
@@ -517,10 +524,10 @@ class RemoveCommand(Command):
         self.format = "|/remove|erase : >/tags"
 
     def do_process(self):
-        for tag in self.params.get("tag"):
+        for tag in self.params.get("tags"):
             tag = self.scene.resolve_tag(tag, Command.globalData.sprites.keys())
             if tag is not None:
-                Command.globalData.sprites.remove(tag)
+                Command.globalData.sprites.sprite_remove(tag)
 
 
 # *************************************************************************************************
@@ -789,9 +796,9 @@ class AdvanceCommand(Command):
             if self.params.get("by") == "by":
                 if "reverse" in self.params.command:
                     frame *= -1
-                Command.globalData.sprites.get_sprite(tag).next_frame(frame)
+                Command.globalData.sprites.get_sprite(tag).advance(frame)
             else:
-                Command.globalData.sprites.get_sprite(tag).move_to(frame)
+                Command.globalData.sprites.get_sprite(tag).get_frame(frame)
 
 
 # *************************************************************************************************
@@ -925,6 +932,9 @@ class StopCommand(Command):
         self.format = "|/stop|disable : >/list"
 
     def do_process(self):
+        if not self.params.get("list"):
+            self.scene.stop()
+            return
         for scene_name in self.params.get("list"):
             for scene_key in Command.globalData.scenes.keys():
                 if scene_key == scene_name:
@@ -995,7 +1005,7 @@ class PauseCommand(Command):
         for tag in tag_list:
             s_tag = self.scene.resolve_tag(tag, Command.globalData.sprites.keys())
             if s_tag is not None:
-                Command.globalData.sprites.get_sprite(s_tag).paused = True
+                Command.globalData.sprites.get_sprite(s_tag).set_paused(True)
 
 
 class ResumeCommand(Command):
@@ -1012,7 +1022,7 @@ class ResumeCommand(Command):
         for tag in tag_list:
             s_tag = self.scene.resolve_tag(tag, Command.globalData.sprites.keys())
             if s_tag is not None:
-                Command.globalData.sprites.get_sprite(s_tag).paused = False
+                Command.globalData.sprites.get_sprite(s_tag).set_paused(False)
 
 # *************************************************************************************************
 #
@@ -1187,7 +1197,7 @@ class AddGroupCommand(Command):
         for item in self.params.get("list"):
             item = self.scene.resolve_tag(item, Command.globalData.sprites.keys())
             if item is not None:
-                Command.globalData.sprites.get_sprite(item).group = group_name
+                Command.globalData.sprites.set_group(Command.globalData.sprites.get_sprite(item), group_name)
 
 # *************************************************************************************************
 #
@@ -1217,7 +1227,11 @@ class AddGroupCommand(Command):
 
 class DumpCommand(Command):
     """
-        dump vars|scenes|sprites
+        dump vars|scenes|actions|profile|cache|pool|resources
+        (profile writes the profiler's timings to a file in the script folder,
+        cache shows how often rendered sprites are found in the render cache,
+        pool shows how well scratch surfaces are being re-used,
+        resources lists the images and sounds with their sizes and how many are using each)
     """
 
     def __init__(self):
@@ -1238,6 +1252,17 @@ class DumpCommand(Command):
                         print("Actions in scene %s" % key)
                         for action in value.action_list:
                             action.dump()
+            elif dump.startswith("profile"):
+                Profiler.dump(os.path.join(Command.globalData.options["dir"], PROFILE_FILENAME))
+            elif dump.startswith("cache"):
+                sprites.SpriteItem.render_cache.dump()
+            elif dump.startswith("pool"):
+                sprites.SpriteItem.surface_pool.dump()
+            elif dump.startswith("resource"):
+                print("Images")
+                Command.globalData.images.dump()
+                print("Sounds")
+                Command.globalData.sounds.dump()
 
 
 # *************************************************************************************************
@@ -1,10 +1,37 @@
 
 # Tunable params
-FRAMERATE = 10
+FRAMERATE = 10  # default frames per second, --framerate overrides it
 DEFAULT_FILENAME = "script.txt"
 DEFAULT_FOLDER = "demo/"
 SAFE_EVALUATION = False
 HEMISPHERE = "northern"
+RENDER_CACHE_MB = 64  # memory budget for rendered sprite surfaces
+RESOURCE_CACHE_MB = 256  # decoded images kept once nothing is using them, --resources overrides it
+FOLDER_CACHE_MB = 64  # decoded frames kept for each folder animation
+FOLDER_PREFETCH_FRAMES = 8  # frames loaded ahead for folders too big to keep
+GIF_CACHE_MB = 64  # largest animated GIF decoded once and kept, bigger ones are played as movies
+GIF_FRAME_MILLIS = 100  # for GIF frames that don't say how long they are shown
+MOVIE_QUEUE_FRAMES = 8  # frames decoded ahead of the one showing
+MOVIE_MAX_GAP = 1.0  # seconds, a movie that has been off screen for longer carries on from here
+MOVIE_WAIT_SECONDS = 1.0  # longest to wait for the decoder on a stepped clock
+SURFACE_POOL_MB = 16  # spare scratch surfaces kept for re-use
+SURFACE_POOL_QUANTUM = 32  # pixels, scratch surface sizes are rounded up to this
+ROTATION_QUANTUM = 0.5  # degrees, rotations are rounded to this before rendering
+ROTATION_ATLAS_STEP = 0  # degrees between the renderings in a rotation atlas, 0 for no atlases
+ROTATION_ATLAS_MIN_TURN = 180  # degrees, sprites turning less than this don't get an atlas
+ROTATION_ATLAS_MB = 32  # memory budget for all the rotation atlases
+BLUR_QUANTUM = 2  # pixels, blur radii are rounded down to this before rendering
+BLUR_FULL_RADIUS = 4  # pixels, bigger blurs are done on a scaled down copy of the sprite
+LAYER_MIN_SPRITES = 2  # static sprites in a row before they are flattened into one layer
+OCCLUSION_MAX_PIECES = 16  # visible parts of a sprite worth tracking before it is just painted whole
+IDLE_MAX_WAIT = 1000  # millis, longest the main loop sleeps in idle mode
+EXPORT_QUEUE_FRAMES = 32  # frames waiting to be written when exporting
+EXPORT_SECONDS = 60  # length of an export if not given
+PROFILE_SECONDS = 5  # the profiler keeps timings for this long
+PROFILE_KEY = "f12"  # shows or hides the profiler overlay (a pygame key name)
+PROFILE_TOP = 12  # lines in the profiler overlay
+PROFILE_FONT_SIZE = 16
+PROFILE_FILENAME = "profile.txt"  # written to the script folder by "dump profile"
 
 # You should probably leave these alone...
 # WORD_SPLIT = '(\"[^\"]+\")|([,;\\s]+)'
@@ -1,6 +1,7 @@
 # standard libraries
 # local modules
 import commands
+from profiler import Profiler
 
 
 class Dispatcher:
@@ -19,7 +20,9 @@ class Dispatcher:
         complete = None
         for command in self.command_list:
             if command.invoked(content):
+                started = Profiler.start()
                 complete = command.process(scene)
+                Profiler.stop("command %s" % command.__class__.__name__, started)
                 break
         if complete is None:
             print("Unknown command: %s" % content)
@@ -0,0 +1,207 @@
+import os, stat, threading, queue
+
+from abc import abstractmethod
+import numpy
+import pygame
+import cv2
+
+from defaults import *
+
+# *************************************************************************************************
+#
+#    ######## ########     ###    ##     ## ########    ##      ## ########  #### ######## ######## ########
+#    ##       ##     ##   ## ##   ###   ### ##          ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ##       ##     ##  ##   ##  #### #### ##          ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ######   ########  ##     ## ## ### ## ######      ##  ##  ## ########   ##     ##    ######   ########
+#    ##       ##   ##   ######### ##     ## ##          ##  ##  ## ##   ##    ##     ##    ##       ##   ##
+#    ##       ##    ##  ##     ## ##     ## ##          ##  ##  ## ##    ##   ##     ##    ##       ##    ##
+#    ##       ##     ## ##     ## ##     ## ########     ###  ###  ##     ## ####    ##    ######## ##     ##
+#
+# **************************************************************************************************
+
+
+class FrameWriter:
+    """
+    Turns the frames of an exported scene into files, all the writing happens on the
+    Exporter's thread so the main loop only has to copy each frame
+    """
+
+    def __init__(self, path, size, framerate):
+        self.path = path
+        self.size = size
+        self.framerate = framerate
+
+    @abstractmethod
+    def write(self, frame, number):
+        """
+        frame is the bytes of one RGB frame, number counts up from 0
+        """
+        pass
+
+    def close(self):
+        pass
+
+# *************************************************************************************************
+#
+#    ########  ##    ##  ######      ##      ## ########  #### ######## ######## ########
+#    ##     ## ###   ## ##    ##     ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ##     ## ####  ## ##           ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ########  ## ## ## ##   ####    ##  ##  ## ########   ##     ##    ######   ########
+#    ##        ##  #### ##    ##     ##  ##  ## ##   ##    ##     ##    ##       ##   ##
+#    ##        ##   ### ##    ##     ##  ##  ## ##    ##   ##     ##    ##       ##    ##
+#    ##        ##    ##  ######       ###  ###  ##     ## ####    ##    ######## ##     ##
+#
+# **************************************************************************************************
+
+
+class PngWriter(FrameWriter):
+    """
+    A numbered PNG file for each frame. The path is either a folder (frames are called
+    frame00000.png and so on) or a file name with a % format for the number, e.g. out/f%04d.png
+    """
+
+    def __init__(self, path, size, framerate):
+        super().__init__(path, size, framerate)
+        if "%" not in path:
+            path = os.path.join(path, "frame%05d.png")
+        self.pattern = path
+        folder = os.path.dirname(path)
+        if folder != "":
+            os.makedirs(folder, exist_ok=True)
+
+    def write(self, frame, number):
+        pygame.image.save(pygame.image.frombytes(frame, self.size, "RGB"), self.pattern % number)
+
+# *************************************************************************************************
+#
+#    ########     ###    ##      ##    ##      ## ########  #### ######## ######## ########
+#    ##     ##   ## ##   ##  ##  ##    ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ##     ##  ##   ##  ##  ##  ##    ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ########  ##     ## ##  ##  ##    ##  ##  ## ########   ##     ##    ######   ########
+#    ##   ##   ######### ##  ##  ##    ##  ##  ## ##   ##    ##     ##    ##       ##   ##
+#    ##    ##  ##     ## ##  ##  ##    ##  ##  ## ##    ##   ##     ##    ##       ##    ##
+#    ##     ## ##     ##  ###  ###      ###  ###  ##     ## ####    ##    ######## ##     ##
+#
+# **************************************************************************************************
+
+
+class RawWriter(FrameWriter):
+    """
+    Raw RGB24 frames, one after another. The path can be a named pipe (see mkfifo) for another
+    program to read from, e.g. ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH -r FPS -i pipe-name
+    (standard output is no good as the log command and pygame write to it)
+    """
+
+    def __init__(self, path, size, framerate):
+        super().__init__(path, size, framerate)
+        self.file = open(path, "wb")
+
+    def write(self, frame, number):
+        self.file.write(frame)
+
+    def close(self):
+        self.file.close()
+
+# *************************************************************************************************
+#
+#    ##     ## #### ########  ########  #######     ##      ## ########  #### ######## ######## ########
+#    ##     ##  ##  ##     ## ##       ##     ##    ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ##     ##  ##  ##     ## ##       ##     ##    ##  ##  ## ##     ##  ##     ##    ##       ##     ##
+#    ##     ##  ##  ##     ## ######   ##     ##    ##  ##  ## ########   ##     ##    ######   ########
+#     ##   ##   ##  ##     ## ##       ##     ##    ##  ##  ## ##   ##    ##     ##    ##       ##   ##
+#      ## ##    ##  ##     ## ##       ##     ##    ##  ##  ## ##    ##   ##     ##    ##       ##    ##
+#       ###    #### ########  ########  #######      ###  ###  ##     ## ####    ##    ######## ##     ##
+#
+# **************************************************************************************************
+
+
+class VideoWriter(FrameWriter):
+    """
+    A video file written by OpenCV, the codec depends on the file extension
+    """
+    codecs = {".avi": "MJPG", ".mp4": "mp4v", ".mov": "mp4v", ".mkv": "mp4v"}
+
+    def __init__(self, path, size, framerate):
+        super().__init__(path, size, framerate)
+        extension = os.path.splitext(path)[1].lower()
+        fourcc = cv2.VideoWriter_fourcc(*self.codecs.get(extension, "mp4v"))
+        self.video = cv2.VideoWriter(path, fourcc, framerate, size)
+        if not self.video.isOpened():
+            print("Unable to write video to %s" % path)
+
+    def write(self, frame, number):
+        image = numpy.frombuffer(frame, dtype=numpy.uint8).reshape((self.size[1], self.size[0], 3))
+        self.video.write(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+
+    def close(self):
+        self.video.release()
+
+# *************************************************************************************************
+#
+#    ######## ##     ## ########   #######  ########  ######## ######## ########
+#    ##        ##   ##  ##     ## ##     ## ##     ##    ##    ##       ##     ##
+#    ##         ## ##   ##     ## ##     ## ##     ##    ##    ##       ##     ##
+#    ######      ###    ########  ##     ## ########     ##    ######   ########
+#    ##         ## ##   ##        ##     ## ##   ##      ##    ##       ##   ##
+#    ##        ##   ##  ##        ##     ## ##    ##     ##    ##       ##    ##
+#    ######## ##     ## ##         #######  ##     ##    ##    ######## ##     ##
+#
+# **************************************************************************************************
+
+
+class Exporter:
+    """
+    Takes frames from the main loop and hands them to a FrameWriter on a thread of its own.
+    The queue between them is bounded, so memory use stays fixed: the main loop only waits
+    if the writer falls more than EXPORT_QUEUE_FRAMES behind.
+    """
+    writers = {"png": PngWriter, "raw": RawWriter, "video": VideoWriter}
+
+    def __init__(self, path, size, framerate, format=None):
+        if format is None:
+            format = self.guess_format(path)
+        if format not in self.writers:
+            print("Unknown export format %s, use png, raw or video" % format)
+            format = "video"
+        self.writer = self.writers[format](path, size, framerate)
+        self.frames = queue.Queue(maxsize=EXPORT_QUEUE_FRAMES)
+        self.count = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="exporter", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def guess_format(path):
+        lower = path.lower()
+        if lower.endswith((".rgb", ".raw")) or (os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode)):
+            return "raw"
+        if "%" in path or lower.endswith(".png") or os.path.isdir(path) or os.path.splitext(path)[1] == "":
+            return "png"
+        return "video"
+
+    def put(self, surface):
+        if self.error is not None:
+            raise RuntimeError("Export failed: %s" % self.error)
+        self.frames.put(pygame.image.tobytes(surface, "RGB"))
+
+    def run(self):
+        number = 0
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            try:
+                if self.error is None:
+                    self.writer.write(frame, number)
+            except Exception as e:
+                # keep taking frames so the main loop is not stuck, it will see the error
+                print("Export failed at frame %d: %s" % (number, e))
+                self.error = e
+            number += 1
+        self.count = number
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        self.writer.close()
+        print("Exported %d frames" % self.count)
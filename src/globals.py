@@ -1,5 +1,6 @@
 import dispatcher
 import vars, sprites
+from resources import Resources
 from defaults import *
 
 
@@ -9,13 +10,20 @@ class Globals:
         # global data structures
         self.scenes = {}
         self.sprites = sprites.SpriteList()
-        self.sounds = {}
-        self.images = {}
+        # sounds are never evicted, one might be playing
+        self.sounds = Resources()
+        self.images = Resources(RESOURCE_CACHE_MB * 1024 * 1024, sprites.SpriteItem.render_cache.discard)
         self.vars = vars.Variables(self)
         self.command_dispatcher = dispatcher.Dispatcher()
         self.options = {"width": 1080, "height": 1920, "fullscreen": False,
                         "dir": DEFAULT_FOLDER, "file": DEFAULT_FILENAME,
-                        "help": False, "safe": SAFE_EVALUATION}
+                        "help": False, "safe": SAFE_EVALUATION,
+                        "cache": RENDER_CACHE_MB, "renderer": "full",
+                        "framerate": FRAMERATE, "idle": False,
+                        "clock": "real", "speed": 1.0, "start": None,
+                        "export": None, "format": None, "length": EXPORT_SECONDS,
+                        "profile": False, "atlas": ROTATION_ATLAS_STEP,
+                        "premultiplied": False, "resources": RESOURCE_CACHE_MB}
 
     def dump_options(self):
         for key, value in self.options.items():
@@ -1,9 +1,29 @@
-import glob
+import bisect, glob, threading, queue, weakref
+from collections import OrderedDict
 
 from abc import abstractmethod
 import pygame
 import cv2
 
+from defaults import *
+from rendercache import fully_opaque, surface_bytes
+from timing import Clock, Timer
+
+
+def display_format(surface):
+    """
+    Convert a loaded image to the display's pixel format, so that it isn't converted again every
+    time it is drawn. Images without any transparency lose their alpha channel, which makes them
+    quicker to draw and lets them be rendered as solid. Needs the display to be open
+    """
+    if pygame.display.get_surface() is None:
+        return surface
+    if surface.get_flags() & pygame.SRCALPHA or surface.get_colorkey() is not None:
+        converted = surface.convert_alpha()
+        if not fully_opaque(converted):
+            return converted
+    return surface.convert()
+
 # *************************************************************************************************
 #
 #    #### ##     ##    ###     ######   ######## #### ######## ######## ##     ##
@@ -31,6 +51,21 @@ class ImageItem:
     def next_frame(self, advance_by=1):
         pass
 
+    def frame_key(self):
+        """
+        Identifies the current frame for the render cache, None if the content can change
+        without the frame changing (so it must never be cached)
+        """
+        return None
+
+    def byte_size(self):
+        """
+        Memory used by the decoded image, see resources.Resources
+        """
+        if self.surface is None:
+            return 0
+        return surface_bytes(self.surface)
+
 # *************************************************************************************************
 #
 #     ######  #### ##     ## ########  ##       ######## #### ##     ##    ###     ######   ########
@@ -48,7 +83,7 @@ class SimpleImage(ImageItem):
 
     def __init__(self, filename, rows=1, columns=1):
         super().__init__()
-        self.surface = pygame.image.load(filename)
+        self.surface = display_format(pygame.image.load(filename))
         self.image_rect = pygame.Rect(0, 0, self.surface.get_width(), self.surface.get_height())
 
     def move_to_frame(self, number):
@@ -57,6 +92,9 @@ class SimpleImage(ImageItem):
     def next_frame(self, advance_by=1):
         pass
 
+    def frame_key(self):
+        return self, 0
+
 # *************************************************************************************************
 #
 #     ######  ######## ##       ##       #### ##     ##    ###     ######   ########
@@ -74,7 +112,7 @@ class CellImage(ImageItem):
 
     def __init__(self, filename, rows=1, columns=1):
         super().__init__()
-        self.surface = pygame.image.load(filename)
+        self.surface = display_format(pygame.image.load(filename))
         self.current_frame = 0
         self.rows = rows if rows is not None else 1
         self.columns = columns if columns is not None else 1
@@ -97,6 +135,77 @@ class CellImage(ImageItem):
     def next_frame(self, advance_by=1):
         self.move_to_frame(self.current_frame + advance_by)
 
+    def frame_key(self):
+        return self, tuple(self.image_rect)
+
+# *************************************************************************************************
+#
+#       ###    ##    ## #### ##     ##    ###    ######## ######## ########  #### ##     ##    ###     ######   ########
+#      ## ##   ###   ##  ##  ###   ###   ## ##      ##    ##       ##     ##  ##  ###   ###   ## ##   ##    ##  ##
+#     ##   ##  ####  ##  ##  #### ####  ##   ##     ##    ##       ##     ##  ##  #### ####  ##   ##  ##        ##
+#    ##     ## ## ## ##  ##  ## ### ## ##     ##    ##    ######   ##     ##  ##  ## ### ## ##     ## ##   #### ######
+#    ######### ##  ####  ##  ##     ## #########    ##    ##       ##     ##  ##  ##     ## ######### ##    ##  ##
+#    ##     ## ##   ###  ##  ##     ## ##     ##    ##    ##       ##     ##  ##  ##     ## ##     ## ##    ##  ##
+#    ##     ## ##    ## #### ##     ## ##     ##    ##    ######## ########  #### ##     ## ##     ##  ######   ########
+#
+# **************************************************************************************************
+
+
+class AnimatedImage(ImageItem):
+    """
+    An animated GIF, decoded once when it is loaded into a list of frames in the display format.
+    Each frame is shown for its own duration by the clock, however often next_frame is called.
+    GIFs too big to keep (see fits) are played as a Movie instead
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self.frames = []
+        self.ends = []  # millis from the start of the loop when each frame has been shown
+        total = 0
+        for surface, millis in pygame.image.load_animation(filename):
+            self.frames.append(display_format(surface))
+            total += millis if millis > 0 else GIF_FRAME_MILLIS
+            self.ends.append(total)
+        self.current_frame = 0
+        self.position = 0  # millis into the loop
+        self.last_time = None
+        self.surface = self.frames[0]
+        self.image_rect = self.surface.get_rect()
+
+    @staticmethod
+    def fits(filename):
+        video = cv2.VideoCapture(filename)
+        frame_bytes = video.get(cv2.CAP_PROP_FRAME_WIDTH) * video.get(cv2.CAP_PROP_FRAME_HEIGHT) * 4
+        all_bytes = frame_bytes * video.get(cv2.CAP_PROP_FRAME_COUNT)
+        video.release()
+        return 0 < all_bytes <= GIF_CACHE_MB * 1024 * 1024
+
+    def move_to_frame(self, number):
+        self.current_frame = number % len(self.frames)
+        self.position = self.ends[self.current_frame - 1] if self.current_frame > 0 else 0
+        self.last_time = Timer.millis()
+        self.surface = self.frames[self.current_frame]
+
+    def next_frame(self, advance_by=1):
+        if advance_by != 1:
+            # stepped on (or back) by a number of frames, "advance ... by"
+            self.move_to_frame(self.current_frame + advance_by)
+            return
+        now = Timer.millis()
+        if self.last_time is not None:
+            # don't jump ahead after a long wait (paused or not being updated)
+            self.position = (self.position + min(now - self.last_time, MOVIE_MAX_GAP * 1000)) % self.ends[-1]
+        self.last_time = now
+        self.current_frame = bisect.bisect_right(self.ends, self.position)
+        self.surface = self.frames[self.current_frame]
+
+    def frame_key(self):
+        return self, self.current_frame
+
+    def byte_size(self):
+        return sum(surface_bytes(frame) for frame in self.frames)
+
 # *************************************************************************************************
 #
 #    #### ##     ##    ###     ######   ######## ########  #######  ##       ########  ######## ########
@@ -111,25 +220,99 @@ class CellImage(ImageItem):
 
 
 class ImageFolder(ImageItem):
+    """
+    A folder of PNG files shown one after another. Decoded frames are kept, up to FOLDER_CACHE_MB
+    for each folder: if they all fit they are loaded straight away, otherwise a thread loads the
+    next FOLDER_PREFETCH_FRAMES ahead of the one showing and the least recently shown are dropped
+    """
 
     def __init__(self, folder_name):
         super().__init__()
         self.file_list = sorted(glob.glob(folder_name + "/*.png"))
         self.current_file = 0
-        self.surface = pygame.image.load(self.file_list[0])
+        self.frames = OrderedDict()  # frame number -> surface, least recently used first
+        self.frames_bytes = 0
+        self.max_bytes = int(FOLDER_CACHE_MB * 1024 * 1024)
+        self.lock = threading.Lock()  # around frames, which the prefetch thread adds to
+        self.wanted = None
+        self.surface = self.frame(0)
         self.image_rect = pygame.Rect(0, 0, self.surface.get_width(), self.surface.get_height())
+        if self.frames_bytes * len(self.file_list) <= self.max_bytes:
+            for number in range(1, len(self.file_list)):
+                self.frame(number)
+        else:
+            self.wanted = queue.Queue()
+            # the thread only holds a weak reference, so the folder can still be freed
+            threading.Thread(target=self.prefetch, args=(weakref.ref(self), self.wanted),
+                             name="prefetch", daemon=True).start()
+
+    def load(self, number):
+        surface = display_format(pygame.image.load(self.file_list[number]))
+        with self.lock:
+            if number not in self.frames:
+                self.frames[number] = surface
+                self.frames_bytes += surface_bytes(surface)
+                while self.frames_bytes > self.max_bytes and len(self.frames) > 1:
+                    old_number, old_surface = self.frames.popitem(last=False)
+                    self.frames_bytes -= surface_bytes(old_surface)
+            return self.frames[number]
+
+    def frame(self, number):
+        with self.lock:
+            surface = self.frames.get(number)
+            if surface is not None:
+                self.frames.move_to_end(number)
+                return surface
+        # not loaded (or prefetched) yet
+        return self.load(number)
+
+    @staticmethod
+    def prefetch(folder_ref, wanted):
+        while True:
+            number = wanted.get()
+            # only the latest request matters if we have fallen behind
+            while not wanted.empty() and number is not None:
+                number = wanted.get()
+            folder = folder_ref()
+            if number is None or folder is None:
+                return
+            # no further ahead than fits, or the frames would be dropped before they are shown
+            frame_bytes = surface_bytes(folder.surface)
+            ahead = min(FOLDER_PREFETCH_FRAMES, folder.max_bytes // frame_bytes - 2)
+            upcoming = [(number + count) % len(folder.file_list) for count in range(1, ahead + 1)]
+            for next_number in upcoming:
+                with folder.lock:
+                    loaded = next_number in folder.frames
+                if not loaded:
+                    folder.load(next_number)
+            with folder.lock:
+                # count the frames about to be shown as used, the next one most recently,
+                # so that the ones already shown are dropped first
+                for next_number in reversed(upcoming):
+                    if next_number in folder.frames:
+                        folder.frames.move_to_end(next_number)
+            del folder
 
     def move_to_frame(self, number):
-        if number > len(self.file_list):
-            number = 0
-        elif number < 0:
-            number = len(self.file_list) - 1
-        self.current_file = number
-        self.surface = pygame.image.load(self.file_list[self.current_file])
+        self.current_file = number % len(self.file_list)
+        self.surface = self.frame(self.current_file)
+        if self.wanted is not None:
+            self.wanted.put(self.current_file)
 
     def next_frame(self, advance_by=1):
         self.move_to_frame(self.current_file + advance_by)
 
+    def frame_key(self):
+        return self, self.current_file
+
+    def byte_size(self):
+        with self.lock:
+            return self.frames_bytes
+
+    def __del__(self):
+        if self.wanted is not None:
+            self.wanted.put(None)
+
 # *************************************************************************************************
 #
 #     ######   ########   #######  ##     ## ########  #### ##     ##    ###     ######   ########
@@ -144,6 +327,11 @@ class ImageFolder(ImageItem):
 
 
 class GroupImage(ImageItem):
+    """
+    The sprites in a group are painted onto one surface, which is kept from frame to frame and
+    only repainted where a member has changed. version goes up each time it is repainted so the
+    sprites showing the group know when to re-render
+    """
 
     def __init__(self, scene, group_name, in_image_rect=None):
         super().__init__()
@@ -153,13 +341,31 @@ class GroupImage(ImageItem):
             self.image_rect = in_image_rect
         else:
             self.image_rect = pygame.Rect(0, 0, self.scene.data.options["width"], self.scene.data.options["height"])
+        self.surface = pygame.Surface((self.image_rect.width, self.image_rect.height), pygame.SRCALPHA)
+        self.drawn = {}  # what each member looked like when last painted
+        self.version = 0
+
+    def compose(self):
+        sprite_list = self.scene.data.sprites
+        surface_rect = self.surface.get_rect()
+        prepared = []
+        for sprite in sprite_list.group_members(self.group_name):
+            current = sprite.prepare(surface_rect)
+            if current is not None:
+                prepared.append((sprite,) + current)
+        damaged, self.drawn = sprite_list.find_damage(self.drawn, prepared)
+        damaged = sprite_list.merge_rects([rect.clip(surface_rect) for rect in damaged])
+        if len(damaged) == 0:
+            return
+        painting, hidden = sprite_list.occlude([item[1:] for item in prepared], surface_rect)
+        sprite_list.repaint(self.surface, damaged, painting, (0, 0, 0, 0))
+        self.version += 1
 
     def move_to_frame(self, number):
-        self.surface = pygame.Surface((self.image_rect.width, self.image_rect.height), pygame.SRCALPHA)
-        self.scene.data.sprites.display_all(self.surface, self.group_name)
+        self.compose()
 
     def next_frame(self, advance_by=1):
-        self.move_to_frame(0)
+        self.compose()
 
 # *************************************************************************************************
 #
@@ -212,32 +418,89 @@ class TextImage(ImageItem):
 
 
 class Movie(ImageItem):
+    """
+    A video file, decoded on a thread of its own into a queue of up to MOVIE_QUEUE_FRAMES and shown
+    in step with the clock: frames that are already late are dropped, and at the end it seeks back
+    to the start. Sprites don't ask for frames while they are off the screen or hidden (see
+    SpriteItem.update), so the queue fills up and decoding stops until they are back, when the
+    movie carries on from (no more than MOVIE_MAX_GAP seconds after) where it was
+    """
 
     def __init__(self, movie_file):
         super().__init__()
         self.movie_file = movie_file
-        self.video = None
-        self.init_video()
+        self.frames = queue.Queue(maxsize=MOVIE_QUEUE_FRAMES)
+        self.stopping = threading.Event()
+        self.position = 0.0  # seconds of the movie (all the times round) that have been shown
+        self.last_time = None
+        self.pending = None  # (when, surface) taken from the queue but not due yet
+        video = cv2.VideoCapture(movie_file)
+        success, image = video.read()
+        if not success:
+            print("Unable to read movie %s" % movie_file)
+            video.release()
+            return
+        fps = video.get(cv2.CAP_PROP_FPS)
+        frame_seconds = 1 / fps if fps > 0 else 1 / FRAMERATE
+        self.surface = self.to_surface(image)
+        self.image_rect = self.surface.get_rect()
+        threading.Thread(target=self.decode, args=(video, self.frames, self.stopping, frame_seconds),
+                         name="movie", daemon=True).start()
+
+    @staticmethod
+    def to_surface(image):
+        # cv2 frames are rows of BGR pixels, the surface uses the same memory rather than a copy
+        return pygame.image.frombuffer(image, (image.shape[1], image.shape[0]), "BGR")
+
+    @staticmethod
+    def decode(video, frames, stopping, frame_seconds):
+        number = 1  # the first frame is read before the thread starts
+        since_start = 1
+        while not stopping.is_set():
+            success, image = video.read()
+            if not success:
+                # run out of frames, go back to the start (unless there was nothing after it)
+                if since_start == 0 or not video.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                    break
+                since_start = 0
+                continue
+            surface = Movie.to_surface(image)
+            while not stopping.is_set():
+                try:
+                    frames.put((number * frame_seconds, surface), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            number += 1
+            since_start += 1
+        video.release()
 
     def move_to_frame(self, number):  # not supported, just gets next frame
         self.next_frame(number)
 
     def next_frame(self, advance_by=1):
-        success = True
-        advance_by = abs(advance_by)
-        while success:
-            success, image = self.video.read()
-            self.surface = pygame.Surface(image)
-            if --advance_by <= 0:
+        now = Timer.seconds()
+        if self.last_time is not None:
+            # a long wait means the movie wasn't being watched, so don't jump ahead
+            self.position += min(now - self.last_time, MOVIE_MAX_GAP)
+        self.last_time = now
+        # show the latest frame that is due, any others are too late
+        while True:
+            if self.pending is None:
+                try:
+                    # a stepped clock (exporting) waits for every frame rather than dropping them
+                    self.pending = self.frames.get(Clock.mode == "stepped", MOVIE_WAIT_SECONDS)
+                except queue.Empty:
+                    return  # the decoder has fallen behind, keep showing this one
+            when, surface = self.pending
+            if when > self.position:
                 return
-        # run out of frames, go back to the start
-        self.init_video()
+            self.surface = surface
+            self.pending = None
 
-    def init_video(self):
-        self.video = cv2.VideoCapture(self.movie_file)
-        success, image = self.video.read()
-        self.surface = pygame.Surface(image)
-        self.image_rect = self.surface.get_rect()
+    def byte_size(self):
+        # the frame showing, the one waiting to be and those in the queue
+        return super().byte_size() * (MOVIE_QUEUE_FRAMES + 2)
 
     def __del__(self):
-        self.video.release()
+        self.stopping.set()
@@ -2,6 +2,7 @@
 # standard libraries
 import random
 import inspect
+import os
 
 import pygame, sys
 from pygame.locals import *
@@ -9,14 +10,19 @@ from pygame.locals import *
 import action
 # local modules
 import script, globals, sprites, timing
-import commands, args, triggers
+import commands, args, triggers, export
+from profiler import Profiler
 from defaults import *
 
+BACKGROUND = pygame.Color(127, 127, 127)
+
 
 def do_actions(data, millis):
     for name, scene in data.scenes.items():
         if scene.enabled:
+            started = Profiler.start()
             scene.update_triggers(millis)  # update all triggers once this frame
+            Profiler.stop("triggers %s" % name, started)
             for current_action in scene.action_list:
                 # because one trigger may cause multiple actions
                 if not current_action.complete and current_action.triggered():
@@ -26,11 +32,27 @@ def do_actions(data, millis):
             scene.clear_triggers()
 
 
-def handle_events(data):
-    for event in pygame.event.get():
+def idle_timeout(data, millis):
+    """
+    How long (in millis) the main loop can sleep waiting for input, 0 if something is changing
+    """
+    if data.sprites.is_busy():
+        return 0
+    deadlines = [scene.next_deadline(millis) for scene in data.scenes.values() if scene.enabled]
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    if len(deadlines) == 0:
+        return IDLE_MAX_WAIT
+    return int(max(0, min(IDLE_MAX_WAIT, min(deadlines) - millis)))
+
+
+def handle_events(data, events):
+    for event in events:
         if event.type == QUIT:
             pygame.quit()
             sys.exit()
+        elif event.type == pygame.KEYDOWN and pygame.key.name(event.key) == PROFILE_KEY:
+            # show or hide the profiler, not passed on to the script
+            Profiler.toggle_overlay()
         elif event.type == pygame.KEYDOWN:
             triggers.Trigger.keycode = event.unicode
             triggers.Trigger.key_pressed = True
@@ -79,6 +101,113 @@ def print_help(data):
     print_docs(commands)
 
 
+def set_clock(data):
+    if data.options["start"] is not None:
+        timing.Clock.set_time_of_day(data.options["start"])
+    timing.Clock.set_mode(data.options["clock"], data.options["speed"])
+
+
+def wait_for_frame(data, clock):
+    if timing.Clock.mode == "stepped":
+        # no waiting, just move time on by one frame
+        timing.Clock.step(1 / data.options["framerate"])
+    else:
+        clock.tick(data.options["framerate"])
+
+
+def wait_while_idle(data, millis):
+    """
+    Sleep until there is input or a trigger is due, returns the events to handle next
+    """
+    timeout = idle_timeout(data, millis)
+    if timeout <= 0:
+        return []
+    if timing.Clock.mode == "stepped":
+        # nothing to wait for, skip straight there
+        timing.Clock.step(timeout / 1000)
+        return []
+    # wait(0) would wait forever, so never less than a millisecond (a fast scaled clock can ask for less)
+    return [pygame.event.wait(max(1, int(timing.Clock.real_time(timeout))))]
+
+
+def setup(data):
+    """
+    Hand the shared data to the modules that need it, read the script, open the display and start
+    the top level scene. Images are converted to the display's pixel format as they are loaded, so
+    the display has to be open (at the size the script asks for) first.
+    Returns the screen and the window, see open_display
+    """
+    commands.Command.globalData = data
+    sprites.SpriteItem.globalData = data
+    sprites.SpriteItem.render_cache.max_bytes = data.options["cache"] * 1024 * 1024
+    data.images.max_bytes = data.options["resources"] * 1024 * 1024
+    sprites.RotationAtlas.step = data.options["atlas"]
+    sprites.premultiply = data.options["premultiplied"]
+    triggers.Trigger.variables = data.vars
+    action.Action.variables = data.vars
+    script.read(data)
+    screen, window = open_display(data)
+    data.scenes[TOP_LEVEL].start()
+    return screen, window
+
+
+def open_display(data):
+    """
+    Returns the screen and the window (the off-screen surface the sprites are painted on)
+    """
+    pygame.init()
+    pygame.mixer.init()
+    screen = pygame.display.set_mode((data.options["width"], data.options["height"]))
+    window = pygame.Surface((data.options["width"], data.options["height"]))
+    return screen, window
+
+
+def render_frame(data, window):
+    """
+    Paint the sprites onto the window, returns the list of areas that changed (None for all of it)
+    """
+    if data.options["renderer"] == "dirty":
+        # only repaint the areas that changed
+        return data.sprites.display_dirty(window, BACKGROUND)
+    data.sprites.display_all(window, background=BACKGROUND)
+    return None
+
+
+def show_frame(screen, window, rect_list):
+    if rect_list is None:
+        screen.blit(window, (0, 0))
+    else:
+        if Profiler.overlay_rect is not None:
+            # paint over last frame's overlay
+            rect_list = rect_list + [Profiler.overlay_rect]
+            Profiler.overlay_rect = None
+        for rect in rect_list:
+            screen.blit(window, rect, rect)
+    overlay_rect = Profiler.draw_overlay(screen)
+    if rect_list is None:
+        pygame.display.update()
+    else:
+        pygame.display.update(rect_list if overlay_rect is None else rect_list + [overlay_rect])
+
+
+def export_frames(data, window):
+    """
+    Run the script on a stepped clock without a window, sending every frame to the exporter
+    until the export is long enough or the script exits
+    """
+    exporter = export.Exporter(data.options["export"], window.get_size(), data.options["framerate"],
+                               data.options["format"])
+    try:
+        for frame in range(int(data.options["length"] * data.options["framerate"])):
+            handle_events(data, pygame.event.get())
+            do_actions(data, timing.Timer.millis())
+            wait_for_frame(data, None)
+            render_frame(data, window)
+            exporter.put(window)
+    finally:
+        exporter.close()
+
+
 def main():
     # Initialisation coda
     random.seed()
@@ -87,29 +216,40 @@ def main():
     if globalData.options["help"]:
         print_help(globalData)
         exit(0)
-    commands.Command.globalData = globalData
-    sprites.SpriteItem.globalData = globalData
-    triggers.Trigger.variables = globalData.vars
-    action.Action.variables = globalData.vars
-    script.read(globalData)
-    globalData.scenes[TOP_LEVEL].start()
-    pygame.init()
-    pygame.mixer.init()
-    screen = pygame.display.set_mode((globalData.options["width"],
-                                      globalData.options["height"]))
-    window = pygame.Surface((globalData.options["width"], globalData.options["height"]))
-    grey = pygame.Color(127, 127, 127)
+    if globalData.options["export"] is not None:
+        # rendered off screen as fast as possible
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        globalData.options["clock"] = "stepped"
+    Profiler.enabled = globalData.options["profile"]
+    set_clock(globalData)
+    screen, window = setup(globalData)
+    if globalData.options["export"] is not None:
+        export_frames(globalData, window)
+        exit(0)
     clock = pygame.time.Clock()
     # Main loop
+    events = pygame.event.get()
     while True:
-        window.fill(grey)
-        handle_events(globalData)
+        started = Profiler.start()
+        handle_events(globalData, events)
+        Profiler.stop("phase handle_events", started)
+        started = Profiler.start()
         do_actions(globalData, timing.Timer.millis())
-        clock.tick(FRAMERATE)
-        globalData.sprites.display_all(window)
-        screen.blit(window, (0, 0))
-        pygame.display.update()
+        Profiler.stop("phase do_actions", started)
+        wait_for_frame(globalData, clock)
+        started = Profiler.start()
+        rect_list = render_frame(globalData, window)
+        Profiler.stop("phase display", started)
+        started = Profiler.start()
+        show_frame(screen, window, rect_list)
+        Profiler.stop("phase blit_flip", started)
+        events = pygame.event.get()
+        if globalData.options["idle"] and len(events) == 0:
+            # nothing is changing, sleep until there is input or a trigger is due
+            events = wait_while_idle(globalData, timing.Timer.millis())
 
 
 # Processing starts here
-main()
+if __name__ == "__main__":
+    main()
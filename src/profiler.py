@@ -0,0 +1,171 @@
+from collections import deque
+from time import perf_counter
+
+import pygame
+
+from defaults import *
+
+# *************************************************************************************************
+#
+#    ##     ## ####  ######  ########  #######   ######   ########     ###    ##     ##
+#    ##     ##  ##  ##    ##    ##    ##     ## ##    ##  ##     ##   ## ##   ###   ###
+#    ##     ##  ##  ##          ##    ##     ## ##        ##     ##  ##   ##  #### ####
+#    #########  ##   ######     ##    ##     ## ##   #### ########  ##     ## ## ### ##
+#    ##     ##  ##        ##    ##    ##     ## ##    ##  ##   ##   ######### ##     ##
+#    ##     ##  ##  ##    ##    ##    ##     ## ##    ##  ##    ##  ##     ## ##     ##
+#    ##     ## ####  ######     ##     #######   ######   ##     ## ##     ## ##     ##
+#
+# **************************************************************************************************
+
+
+class Histogram:
+    """
+    The durations recorded for one thing over the last PROFILE_SECONDS (real) seconds
+    """
+    buckets = [0.5, 1, 2, 4, 8, 16, 32, 64]  # upper limits in millis, anything longer goes in the last
+
+    def __init__(self):
+        self.samples = deque()  # (when, millis)
+        self.count = 0  # all time
+
+    def add(self, when, millis):
+        self.samples.append((when, millis))
+        self.count += 1
+        # roll over as we go, not just when someone looks, or it grows for ever
+        self.expire(when)
+
+    def expire(self, now):
+        while len(self.samples) > 0 and self.samples[0][0] < now - PROFILE_SECONDS:
+            self.samples.popleft()
+
+    def total(self):
+        return sum(millis for when, millis in self.samples)
+
+    def per_second(self):
+        return self.total() / PROFILE_SECONDS
+
+    def percentile(self, fraction):
+        if len(self.samples) == 0:
+            return 0.0
+        ordered = sorted(millis for when, millis in self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def counts(self):
+        counts = [0] * (len(self.buckets) + 1)
+        for when, millis in self.samples:
+            bucket = 0
+            while bucket < len(self.buckets) and millis > self.buckets[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+        return counts
+
+# *************************************************************************************************
+#
+#    ########  ########   #######  ######## #### ##       ######## ########
+#    ##     ## ##     ## ##     ## ##        ##  ##       ##       ##     ##
+#    ##     ## ##     ## ##     ## ##        ##  ##       ##       ##     ##
+#    ########  ########  ##     ## ######    ##  ##       ######   ########
+#    ##        ##   ##   ##     ## ##        ##  ##       ##       ##   ##
+#    ##        ##    ##  ##     ## ##        ##  ##       ##       ##    ##
+#    ##        ##     ##  #######  ##       #### ######## ######## ##     ##
+#
+# **************************************************************************************************
+
+
+class Profiler:
+    """
+    Times the phases of the main loop, sprite re-renders, trigger checks and commands, each
+    under a name like "phase do_actions" or "render star1". Turned on by --profile or by
+    pressing PROFILE_KEY, which also shows the worst offenders on screen.
+    Use as
+        started = Profiler.start()
+        ...
+        Profiler.stop("phase display", started)
+    start returns None when profiling is off, so it costs next to nothing then.
+    """
+    enabled = False
+    overlay = False
+    histograms = {}
+    overlay_rect = None  # where the overlay was last drawn, so it can be painted over
+    font = None
+
+    @staticmethod
+    def start():
+        return perf_counter() if Profiler.enabled else None
+
+    @staticmethod
+    def stop(name, started):
+        if started is None:
+            return
+        now = perf_counter()
+        histogram = Profiler.histograms.get(name)
+        if histogram is None:
+            histogram = Profiler.histograms[name] = Histogram()
+        histogram.add(now, (now - started) * 1000)
+
+    @staticmethod
+    def toggle_overlay():
+        Profiler.overlay = not Profiler.overlay
+        if Profiler.overlay:
+            Profiler.enabled = True
+
+    @staticmethod
+    def worst(count=None):
+        """
+        Names and histograms, most time spent (per second) first
+        """
+        now = perf_counter()
+        for histogram in Profiler.histograms.values():
+            histogram.expire(now)
+        ranked = sorted(Profiler.histograms.items(), key=lambda item: item[1].per_second(), reverse=True)
+        return ranked if count is None else ranked[:count]
+
+    @staticmethod
+    def report():
+        lines = ["Time spent over the last %d seconds (milliseconds)" % PROFILE_SECONDS,
+                 "%-40s %8s %8s %8s %8s %8s  %s" % ("name", "per sec", "count", "mean", "p95", "max",
+                                                   " ".join("<%g" % limit for limit in Histogram.buckets)
+                                                   + " more")]
+        for name, histogram in Profiler.worst():
+            samples = len(histogram.samples)
+            if samples == 0:
+                continue
+            lines.append("%-40s %8.2f %8d %8.3f %8.3f %8.3f  %s" % (
+                name[:40], histogram.per_second(), samples, histogram.total() / samples,
+                histogram.percentile(0.95), histogram.percentile(1.0),
+                " ".join(str(count) for count in histogram.counts())))
+        return lines
+
+    @staticmethod
+    def dump(filename):
+        try:
+            with open(filename, "w") as file:
+                file.write("\n".join(Profiler.report()) + "\n")
+        except OSError as e:
+            print("Unable to write profile to %s: %s" % (filename, e))
+            return
+        print("Profile written to %s" % filename)
+
+    @staticmethod
+    def draw_overlay(screen):
+        """
+        Show the worst offenders in the top left corner, returns the area drawn on
+        """
+        if not Profiler.overlay:
+            return None
+        if Profiler.font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            Profiler.font = pygame.font.Font(pygame.font.get_default_font(), PROFILE_FONT_SIZE)
+        lines = ["%7.2f ms/s  %s" % (histogram.per_second(), name)
+                 for name, histogram in Profiler.worst(PROFILE_TOP)]
+        images = [Profiler.font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max([image.get_width() for image in images] + [1])
+        rect = pygame.Rect(0, 0, width + 8, sum(image.get_height() for image in images) + 8)
+        screen.fill((0, 0, 0), rect)
+        top = 4
+        for image in images:
+            screen.blit(image, (4, top))
+            top += image.get_height()
+        Profiler.overlay_rect = rect
+        return rect
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+
+import pygame
+
+
+def surface_bytes(surface):
+    """
+    Memory used by the surface's pixels
+    """
+    return surface.get_pitch() * surface.get_height()
+
+
+def fully_opaque(surface):
+    """
+    True if every pixel of the surface is solid
+    """
+    if not surface.get_flags() & pygame.SRCALPHA:
+        return True
+    alpha = pygame.surfarray.pixels_alpha(surface)
+    opaque = alpha.size == 0 or bool(alpha.min() == 255)
+    del alpha  # unlocks the surface
+    return opaque
+
+# *************************************************************************************************
+#
+#    ########  ######## ##    ## ########  ######## ########   ######     ###     ######  ##     ## ########
+#    ##     ## ##       ###   ## ##     ## ##       ##     ## ##    ##   ## ##   ##    ## ##     ## ##
+#    ##     ## ##       ####  ## ##     ## ##       ##     ## ##        ##   ##  ##       ##     ## ##
+#    ########  ######   ## ## ## ##     ## ######   ########  ##       ##     ## ##       ######### ######
+#    ##   ##   ##       ##  #### ##     ## ##       ##   ##   ##       ######### ##       ##     ## ##
+#    ##    ##  ##       ##   ### ##     ## ##       ##    ##  ##    ## ##     ## ##    ## ##     ## ##
+#    ##     ## ######## ##    ## ########  ######## ##     ##  ######  ##     ##  ######  ##     ## ########
+#
+# **************************************************************************************************
+
+
+class RenderCache:
+    """
+    Process-wide store of fully rendered sprite surfaces, keyed on the source image frame
+    plus the (quantized) size, rotation and effect levels used to build them. Identical
+    sprites, or sprites that return to a previous state, share one surface instead of
+    each running the whole transform pipeline. Least recently used entries are dropped
+    once the total size exceeds the byte budget.
+    Cached surfaces are shared, so they must never be drawn on after being stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key is None:
+            return None
+        surface = self.entries.get(key)
+        if surface is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return surface
+
+    def put(self, key, surface):
+        if key is None:
+            return surface
+        size = surface_bytes(surface)
+        if size > self.max_bytes:
+            return surface  # would evict everything else, don't bother
+        if key in self.entries:
+            self.total_bytes -= surface_bytes(self.entries.pop(key))
+        self.entries[key] = surface
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            old_key, old_surface = self.entries.popitem(last=False)
+            self.total_bytes -= surface_bytes(old_surface)
+        return surface
+
+    def discard(self, image):
+        """
+        Drop every entry rendered from the given image resource (e.g. when it is unloaded)
+        """
+        for key in [key for key in self.entries.keys() if key[0][0] is image]:
+            self.total_bytes -= surface_bytes(self.entries.pop(key))
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def dump(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups > 0 else 0
+        print("Render cache: %d surfaces, %d of %d bytes, %.1f%% hits" %
+              (len(self.entries), self.total_bytes, self.max_bytes, hit_rate))
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+
+import pygame
+
+# *************************************************************************************************
+#
+#    ########  ########  ######   #######  ##     ## ########   ######  ########  ######
+#    ##     ## ##       ##    ## ##     ## ##     ## ##     ## ##    ## ##       ##    ##
+#    ##     ## ##       ##       ##     ## ##     ## ##     ## ##       ##       ##
+#    ########  ######    ######  ##     ## ##     ## ########  ##       ######    ######
+#    ##   ##   ##             ## ##     ## ##     ## ##   ##   ##       ##             ##
+#    ##    ##  ##       ##    ## ##     ## ##     ## ##    ##  ##    ## ##       ##    ##
+#    ##     ## ########  ######   #######   #######  ##     ##  ######  ########  ######
+#
+# **************************************************************************************************
+
+
+class Resource:
+    """
+    One loaded image or sound, with what it was loaded by (so it can be loaded again) and the
+    sprites and scenes using it
+    """
+
+    def __init__(self, item, loader=None):
+        self.item = item  # None once evicted
+        self.loader = loader  # None if it can't be loaded again, so is never evicted
+        self.users = set()
+        self.size = 0  # bytes, when last measured
+
+    def measure(self):
+        if self.item is None:
+            self.size = 0
+        elif isinstance(self.item, pygame.mixer.Sound):
+            frequency, size, channels = pygame.mixer.get_init()
+            self.size = int(self.item.get_length() * frequency * channels * abs(size) // 8)
+        else:
+            self.size = self.item.byte_size()
+        return self.size
+
+
+class Resources:
+    """
+    The images (or sounds) loaded by a script, by tag. Used like a dict, but also counts the
+    sprites and scenes using each one: once nothing is, it can be evicted (least recently used
+    first) to keep the total under the byte budget, and is loaded again from its file the next
+    time it is looked up. A budget of None never evicts anything.
+    Sizes are measured when something is loaded or looked up (folders and movies grow as they
+    play), the total is kept as it goes rather than added up each time
+    """
+
+    def __init__(self, max_bytes=None, forget=None):
+        self.max_bytes = max_bytes
+        self.forget = forget  # called with anything evicted or deleted, see RenderCache.discard
+        self.entries = OrderedDict()  # tag -> Resource, least recently used first
+        self.bytes = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def add(self, tag, loader, user=None):
+        """
+        Load a resource by calling loader, which is kept in case it has to be loaded again
+        """
+        resource = Resource(loader(), loader)
+        self.put(tag, resource)
+        self.loads += 1
+        self.acquire(tag, user)
+        self.trim(resource)
+
+    def put(self, tag, resource):
+        if tag in self.entries:
+            del self[tag]
+        self.entries[tag] = resource
+        self.bytes += resource.measure()
+
+    def remeasure(self, resource):
+        old_size = resource.size
+        self.bytes += resource.measure() - old_size
+
+    def acquire(self, tag, user):
+        resource = self.entries.get(tag)
+        if resource is not None and user is not None:
+            resource.users.add(user)
+
+    def release(self, tag, user):
+        resource = self.entries.get(tag)
+        if resource is not None:
+            resource.users.discard(user)
+            if len(resource.users) == 0:
+                self.trim()
+
+    def release_all(self, user):
+        for resource in self.entries.values():
+            resource.users.discard(user)
+        self.trim()
+
+    def use(self, tag, user):
+        """
+        Look up a resource for a new user, who keeps it loaded until they release it
+        """
+        self.acquire(tag, user)
+        return self[tag]
+
+    def __getitem__(self, tag):
+        resource = self.entries[tag]
+        self.entries.move_to_end(tag)
+        item = resource.item
+        if item is None:
+            item = resource.item = resource.loader()
+            self.loads += 1
+        self.remeasure(resource)
+        # not the one being handed out, or it would be loaded again next time
+        self.trim(resource)
+        return item
+
+    def __setitem__(self, tag, item):
+        # made by the script (text, groups) rather than loaded, so it is kept until deleted
+        self.put(tag, Resource(item))
+
+    def __delitem__(self, tag):
+        resource = self.entries.pop(tag)
+        self.bytes -= resource.size
+        if resource.item is not None and self.forget is not None:
+            self.forget(resource.item)
+
+    def __contains__(self, tag):
+        return tag in self.entries
+
+    def keys(self):
+        return self.entries.keys()
+
+    def evict(self, resource):
+        self.bytes -= resource.size
+        if self.forget is not None:
+            self.forget(resource.item)
+        resource.item = None
+        resource.size = 0
+        self.evictions += 1
+
+    def trim(self, keep=None):
+        if self.max_bytes is None or self.bytes <= self.max_bytes:
+            return
+        for resource in list(self.entries.values()):
+            if self.bytes <= self.max_bytes:
+                break
+            if resource.item is not None and resource.loader is not None and len(resource.users) == 0 \
+                    and resource is not keep:
+                self.evict(resource)
+
+    def stats(self):
+        return {"resources": len(self.entries),
+                "loaded": sum(1 for resource in self.entries.values() if resource.item is not None),
+                "bytes": self.bytes, "loads": self.loads, "evictions": self.evictions}
+
+    def dump(self):
+        for tag, resource in self.entries.items():
+            print("%s: %s, %d bytes, used by %d" %
+                  (tag, "evicted" if resource.item is None else resource.item.__class__.__name__,
+                   resource.size, len(resource.users)))
+        stats = self.stats()
+        print("%d resources, %d loaded, %d bytes of %s, %d loads, %d evictions" %
+              (stats["resources"], stats["loaded"], stats["bytes"],
+               "unlimited" if self.max_bytes is None else self.max_bytes, stats["loads"], stats["evictions"]))
@@ -90,6 +90,11 @@ class Scene:
         for trigger in self.trigger_list:
             trigger.test_update(millis)
 
+    def next_deadline(self, millis):
+        deadlines = [trigger.next_deadline(millis) for trigger in self.trigger_list]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return min(deadlines) if len(deadlines) > 0 else None
+
     def clear_triggers(self):
         for trigger in self.trigger_list:
             trigger.clear()
@@ -102,10 +107,14 @@ class Scene:
             self.enabled = False  # stop running (duh)
             self.action_list = []  # discard all our action objects
             # and remove all our sprites
-            for key, sprite in self.data.sprites.items():
-                if sprite.scene == self.name:
-                    del self.data.sprites[key]
+            for sprite in list(self.data.sprites.get_list()):
+                if sprite.scene is self:
+                    self.data.sprites.sprite_remove(sprite.tag)
             # however, sounds play to the end. TODO, is this OK?
+            # Our images can now be evicted if nothing else is using them (they are loaded
+            # again if we restart), see Resources
+            self.data.images.release_all(self)
+            self.data.sounds.release_all(self)
             # And clear all variables
             self.data.vars.purge(self.name)
 
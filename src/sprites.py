@@ -1,10 +1,94 @@
+import bisect
 import math
+import weakref
 from io import UnsupportedOperation
 
 import pygame
+from animation import AnimationStore, EASE_LINEAR
 from defaults import *
+from profiler import Profiler
+from rendercache import RenderCache, fully_opaque, surface_bytes
+from surfacepool import SurfacePool
 from timing import Timer
 
+
+premultiply = False  # paint with premultiplied alpha where it gives the same result, --premultiplied
+premultiplied_surfaces = weakref.WeakKeyDictionary()
+
+
+def premultiplied(surface):
+    """
+    Copy of the surface with its colours multiplied by its alpha, for BLEND_PREMULTIPLIED,
+    only made once for each surface
+    """
+    copy = premultiplied_surfaces.get(surface)
+    if copy is None:
+        copy = premultiplied_surfaces[surface] = surface.premul_alpha()
+    return copy
+
+
+def paint(screen, surface, position, opacity=255, area=None):
+    """
+    Blit a rendered surface with the sprite's overall opacity. Rendered surfaces can be shared
+    between sprites, so the surface alpha is set on every paint rather than stored.
+    If area (in screen coordinates) is given only that part of the surface is painted
+    """
+    if premultiply and opacity == 255 and surface.get_flags() & pygame.SRCALPHA \
+            and not screen.get_flags() & pygame.SRCALPHA:
+        # onto something solid, where premultiplied alpha comes out the same (it ignores the
+        # surface alpha, so not for anything faded)
+        surface = premultiplied(surface)
+        if area is None:
+            screen.blit(surface, position, special_flags=pygame.BLEND_PREMULTIPLIED)
+        else:
+            screen.blit(surface, area.topleft, area.move(-position.x, -position.y),
+                        special_flags=pygame.BLEND_PREMULTIPLIED)
+        return
+    if opacity < 255 or surface.get_flags() & pygame.SRCALPHA:
+        alpha = opacity
+    else:
+        alpha = None  # keep opaque surfaces on the fast blit path
+    if surface.get_alpha() != alpha:
+        surface.set_alpha(alpha)
+    if area is None:
+        screen.blit(surface, position)
+    else:
+        screen.blit(surface, area.topleft, area.move(-position.x, -position.y))
+
+
+opaque_surfaces = weakref.WeakKeyDictionary()
+
+
+def is_opaque(surface):
+    """
+    True if every pixel of the surface is solid, only worked out once for each surface
+    """
+    opaque = opaque_surfaces.get(surface)
+    if opaque is None:
+        opaque = opaque_surfaces[surface] = fully_opaque(surface)
+    return opaque
+
+
+def subtract_rect(pieces, rect):
+    """
+    The parts of the rectangles in pieces that are not inside rect
+    """
+    result = []
+    for piece in pieces:
+        if not piece.colliderect(rect):
+            result.append(piece)
+            continue
+        overlap = piece.clip(rect)
+        # the bands above and below the overlap, then either side of it
+        for band in [pygame.Rect(piece.left, piece.top, piece.width, overlap.top - piece.top),
+                     pygame.Rect(piece.left, overlap.bottom, piece.width, piece.bottom - overlap.bottom),
+                     pygame.Rect(piece.left, overlap.top, overlap.left - piece.left, overlap.height),
+                     pygame.Rect(overlap.right, overlap.top, piece.right - overlap.right, overlap.height)]:
+            if band.width > 0 and band.height > 0:
+                result.append(band)
+    return result
+
+
 # *************************************************************************************************
 #
 #     ######  ########  ########  #### ######## ######## ##       ####  ######  ########
@@ -19,85 +103,324 @@ from timing import Timer
 
 
 class SpriteList:
+    """
+    All the sprites, in painting order (deepest first, then in the order they were added), with an
+    index by tag. The order is kept by a parallel list of sort keys, (-depth, sequence number), so
+    finding, adding and removing sprites are binary searches rather than scans of the list
+    """
 
     def __init__(self):
         self.sprite_list = []
-        self.tag_list = []
+        self.sort_keys = []  # matches sprite_list
+        self.sprites = {}  # tag -> sprite
+        self.sprite_keys = {}  # tag -> its sort key
+        self.sequence = 0
+        # what each sprite looked like when last painted by display_dirty
+        self.drawn = {}
+        self.redraw_all = True
+        # flattened runs of static sprites, see flatten
+        self.layers = {}
+        # sprites that need update called every frame
+        self.animated = set()
+        # group name -> member sprites, in painting order
+        self.groups = {}
 
     def get_list(self):
         return self.sprite_list
 
     def get_sprite(self, sprite_tag):
-        for sprite in self.sprite_list:
-            if sprite.tag == sprite_tag:
-                return sprite
-        return None
+        return self.sprites.get(sprite_tag)
 
     def get_sprite_index(self, sprite_tag):
-        for sprite_pos in range(0, len(self.sprite_list)):
-            if self.sprite_list[sprite_pos].tag == sprite_tag:
-                return sprite_pos
-        return None
+        key = self.sprite_keys.get(sprite_tag)
+        if key is None:
+            return None
+        return bisect.bisect_left(self.sort_keys, key)
 
-    def sprite_add(self, in_sprite):
+    def sprite_add(self, in_sprite, key=None):
         # Maintain an ordered list of sprites, order by sprite.depth
-        sprite_pos = 0
-        while sprite_pos < len(self.sprite_list):
-            if in_sprite.depth > self.sprite_list[sprite_pos].depth:
-                break
-            sprite_pos += 1
+        if in_sprite.tag in self.sprites:
+            # replaces the sprite with the same tag
+            self.sprite_remove(in_sprite.tag)
+        if key is None:
+            # after any others at the same depth
+            self.sequence += 1
+            key = (-in_sprite.depth, self.sequence)
+        sprite_pos = bisect.bisect_right(self.sort_keys, key)
         self.sprite_list.insert(sprite_pos, in_sprite)
-        self.tag_list.append(in_sprite.tag)
+        self.sort_keys.insert(sprite_pos, key)
+        self.sprites[in_sprite.tag] = in_sprite
+        self.sprite_keys[in_sprite.tag] = key
+        self.set_animated(in_sprite)
+        self.refresh_group(in_sprite.group)
 
-    def sprite_remove(self, sprite_tag):
+    def take(self, sprite_tag):
+        """
+        Take the sprite out of the list and the index, returns it (or None)
+        """
         index = self.get_sprite_index(sprite_tag)
-        if index is not None:
-            self.sprite_list.pop(index)
-            self.tag_list.remove(sprite_tag)
+        if index is None:
+            return None
+        sprite = self.sprite_list.pop(index)
+        self.sort_keys.pop(index)
+        del self.sprites[sprite_tag]
+        del self.sprite_keys[sprite_tag]
+        return sprite
+
+    def sprite_remove(self, sprite_tag):
+        sprite = self.take(sprite_tag)
+        if sprite is not None:
+            self.animated.discard(sprite)
+            # stop its values changing, nothing will look at them now
+            sprite.set_paused(True)
+            self.refresh_group(sprite.group)
+            SpriteItem.globalData.images.release(sprite.image_tag, sprite)
 
     def sprite_set_depth(self, sprite_tag, new_depth):
-        index = self.get_sprite_index(sprite_tag)
-        if index is not None:
-            current = self.sprite_list[index]
-            self.sprite_list.pop(index)
+        current = self.take(sprite_tag)
+        if current is not None:
             current.depth = new_depth
             self.sprite_add(current)
 
     def sprite_change_depth(self, sprite_tag, change):
+        """
+        Move the sprite change places towards the front (or back if negative), giving it a depth
+        between its new neighbours
+        """
         index = self.get_sprite_index(sprite_tag)
         # This only makes sense if there are at least 2 sprites
         if index is not None and len(self.sprite_list) > 1:
-            current = self.sprite_list[index]
-            self.sprite_list.pop(index)
-            new_index = index + change
-            new_depth = 0
+            current = self.take(sprite_tag)
+            new_index = max(0, min(len(self.sprite_list), index + change))
+            key = None
             if new_index >= len(self.sprite_list):
-                new_index = len(self.sprite_list) - 1
-                new_depth = self.sprite_list[len(self.sprite_list) - 1].depth + 1
-            elif new_index < 0:
-                new_index = 0
+                new_depth = self.sprite_list[-1].depth - 1
+            elif new_index == 0:
+                new_depth = self.sprite_list[0].depth + 1
             else:
-                new_depth = self.sprite_list[new_index].depth - 1
+                before, after = self.sort_keys[new_index - 1], self.sort_keys[new_index]
+                new_depth = (self.sprite_list[new_index - 1].depth + self.sprite_list[new_index].depth) / 2
+                if before[0] == after[0]:
+                    # the neighbours are at the same depth, so go between them in sequence instead
+                    new_depth = self.sprite_list[new_index].depth
+                    key = (before[0], (before[1] + after[1]) / 2)
             current.depth = new_depth
-            self.sprite_list.insert(new_index, current)
+            self.sprite_add(current, key)
+
+    def set_group(self, sprite, group_name):
+        """
+        Make the sprite part of a group (it is then only painted on the group image, not the screen)
+        """
+        previous = sprite.group
+        sprite.group = group_name
+        self.refresh_group(previous)
+        self.refresh_group(group_name)
+
+    def refresh_group(self, group_name):
+        if group_name is not None:
+            self.groups[group_name] = [sprite for sprite in self.sprite_list if sprite.group == group_name]
+
+    def group_members(self, group_name):
+        return self.groups.get(group_name, [])
+
+    def set_animated(self, sprite):
+        """
+        Keep track of the sprites that have work to do in update every frame
+        """
+        if sprite.is_animated():
+            self.animated.add(sprite)
+        else:
+            self.animated.discard(sprite)
+
+    def is_busy(self):
+        """
+        True if anything could look different next frame without a command being run
+        """
+        if SpriteItem.Adjustable.store.is_busy():
+            return True
+        return any(self.sprite_busy(sprite) for sprite in self.animated)
 
-    def display_all(self, screen, group=None):
+    def sprite_busy(self, sprite):
+        if sprite.paused:
+            return False
+        if sprite.image.__class__.__name__ != "GroupImage":
+            return True
+        # a group only changes when its members do (or it has just been repainted, so shown once more)
+        return sprite.group_changed or any(self.sprite_busy(member) for member in
+                                           self.group_members(sprite.image.group_name) if member in self.animated)
+
+    def display_all(self, screen, background=None):
         # Update values of all current sprites (visible or not)
-        # for adjustable in SpriteItem.Adjustable.instances:
-        #     adjustable.update_value()
-        # And paint them to the screen
+        # And paint everything not in a group to the screen
+        screen_rect = screen.get_rect()
+        painting, covered = self.flatten(self.prepare_all(screen_rect), screen_rect, background)
+        painting, hidden = self.occlude(painting, screen_rect)
+        if background is not None and not (covered or hidden):
+            screen.fill(background)
+        for surface, position, opacity, pieces in painting:
+            for piece in pieces:
+                paint(screen, surface, position, opacity, piece)
+
+    def display_dirty(self, screen, background):
+        """
+        Alternative to display_all that only repaints the parts of the screen that have changed,
+        returns the list of rectangles that were repainted
+        """
+        screen_rect = screen.get_rect()
+        prepared = self.prepare_all(screen_rect)
+        damaged, self.drawn = self.find_damage(self.drawn, prepared)
+        if self.redraw_all:
+            damaged = [screen_rect]
+            self.redraw_all = False
+        damaged = self.merge_rects([rect.clip(screen_rect) for rect in damaged])
+        painting, covered = self.flatten(prepared, screen_rect, background)
+        painting, hidden = self.occlude(painting, screen_rect)
+        self.repaint(screen, damaged, painting, None if covered or hidden else background)
+        return damaged
+
+    @staticmethod
+    def find_damage(drawn, prepared):
+        """
+        Compare the (sprite, surface, position, opacity) list with what was drawn last time, returns
+        the rectangles that need repainting and what is drawn now (to pass in next time)
+        """
+        damaged = []
+        now_drawn = {}
+        for sprite, surface, position, opacity in prepared:
+            now_drawn[sprite] = surface, position, opacity, sprite.depth
+        for sprite, current in now_drawn.items():
+            previous = drawn.pop(sprite, None)
+            if current != previous:
+                # repaint where it was and where it is now
+                if previous is not None:
+                    damaged.append(previous[1])
+                damaged.append(current[1])
+        # anything left over has gone since the last time
+        for surface, position, opacity, depth in drawn.values():
+            damaged.append(position)
+        return damaged, now_drawn
+
+    @staticmethod
+    def repaint(screen, damaged, painting, background):
+        """
+        Paint just the damaged rectangles, clearing them to background first unless it is None
+        """
+        for rect in damaged:
+            screen.set_clip(rect)
+            if background is not None:
+                screen.fill(background)
+            for surface, position, opacity, pieces in painting:
+                for piece in pieces:
+                    if piece.colliderect(rect):
+                        paint(screen, surface, position, opacity, piece)
+        screen.set_clip(None)
+
+    def prepare_all(self, viewport):
+        """
+        Update every sprite, returns (sprite, surface, position, opacity) for each one to be painted
+        on the screen, in depth order. Sprites entirely outside the viewport are left out (and not
+        rendered), though their values carry on changing
+        """
+        prepared = []
+        # Advance every changing value of every sprite in one go
+        SpriteItem.Adjustable.store.step(Timer.seconds())
+        # groups go last so that they are composed from up to date members
+        animated = sorted(self.animated, key=lambda sprite: sprite.image.__class__.__name__ == "GroupImage")
+        for sprite in animated:
+            sprite.update(viewport)
         for sprite in self.sprite_list:
-            if group is None:  # render everything not in a group
-                sprite.update()
-                if sprite.group is None:
-                    sprite.display(screen)
-            else:  # group is given, only render group members
-                if sprite.group == group:
-                    sprite.update()
-                    sprite.display(screen)
+            if sprite.group is None:
+                current = sprite.prepare(viewport)
+                if current is not None:
+                    prepared.append((sprite,) + current)
+        return prepared
+
+    def flatten(self, prepared, screen_rect, background):
+        """
+        Replace runs of static sprites with cached layers, returns the (surface, position, opacity) list
+        to paint and whether the first of these already covers the screen with the background
+        """
+        layers = {}
+        painting = []
+        covered = False
+        run = []
+        for item in prepared + [None]:
+            if item is not None and item[0].is_static():
+                run.append(item)
+                continue
+            if len(run) > 0:
+                # Runs at the bottom are painted over the background, others must not overlap
+                # or the translucent parts would not blend the same way
+                bottom = len(painting) == 0 and background is not None
+                if len(run) >= LAYER_MIN_SPRITES and (bottom or SpriteLayer.separate(run)):
+                    key = (tuple(screen_rect), tuple(background) if bottom else None) + \
+                        tuple((sprite, surface, tuple(position), opacity) for sprite, surface, position, opacity in run)
+                    layer = self.layers.get(key)
+                    if layer is None:
+                        layer = SpriteLayer(run, screen_rect, background if bottom else None)
+                    layers[key] = layer
+                    painting.append((layer.surface, layer.position, 255))
+                    covered = covered or bottom
+                else:
+                    painting += [item[1:] for item in run]
+                run = []
+            if item is not None:
+                painting.append(item[1:])
+        # layers that were not used this frame are out of date
+        for key, layer in self.layers.items():
+            if key not in layers:
+                layer.release()
+        self.layers = layers
+        return painting, covered
+
+    @staticmethod
+    def occlude(painting, screen_rect):
+        """
+        Work down from the top of the (surface, position, opacity) list to find which parts of each
+        can actually be seen past the solid (opaque) ones above it. Returns (surface, position,
+        opacity, pieces) for the ones that can be seen, pieces being the rectangles of the screen
+        to paint, and whether solid sprites cover the whole screen (so it need not be cleared)
+        """
+        visible = []
+        solid = []  # areas of the screen covered by opaque sprites above this one
+        hidden = False
+        for surface, position, opacity in reversed(painting):
+            pieces = [position.clip(screen_rect)]
+            for rect in solid:
+                if len(pieces) > OCCLUSION_MAX_PIECES:
+                    # painting a bit too much is cheaper than working out exactly what
+                    break
+                pieces = subtract_rect(pieces, rect)
+            if len(pieces) == 0:
+                continue
+            visible.append((surface, position, opacity, pieces))
+            if opacity == 255 and is_opaque(surface):
+                solid.append(position)
+                if position.contains(screen_rect):
+                    # nothing below can be seen
+                    hidden = True
+                    break
+        visible.reverse()
+        return visible, hidden
+
+    @staticmethod
+    def merge_rects(rect_list):
+        """
+        Combine overlapping rectangles so that no area is painted twice
+        """
+        merged = []
+        for rect in rect_list:
+            if rect.width <= 0 or rect.height <= 0:
+                continue
+            overlap = rect.collidelist(merged)
+            while overlap >= 0:
+                rect = rect.union(merged.pop(overlap))
+                overlap = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
 
     def keys(self):
-        return self.tag_list
+        return self.sprites.keys()
 
     def dump(self):
         result = ""
@@ -107,6 +430,116 @@ class SpriteList:
             count += 1
         return result
 
+# *************************************************************************************************
+#
+#     ######  ########  ########  #### ######## ######## ##          ###    ##    ## ######## ########
+#    ##    ## ##     ## ##     ##  ##     ##    ##       ##         ## ##    ##  ##  ##       ##     ##
+#    ##       ##     ## ##     ##  ##     ##    ##       ##        ##   ##    ####   ##       ##     ##
+#     ######  ########  ########   ##     ##    ######   ##       ##     ##    ##    ######   ########
+#          ## ##        ##   ##    ##     ##    ##       ##       #########    ##    ##       ##   ##
+#    ##    ## ##        ##    ##   ##     ##    ##       ##       ##     ##    ##    ##       ##    ##
+#     ######  ##        ##     ## ####    ##    ######## ######## ##     ##    ##    ######## ##     ##
+#
+# **************************************************************************************************
+
+
+class SpriteLayer:
+    """
+    A run of static sprites painted onto one surface, so that they cost a single blit per frame.
+    The surface is borrowed from the surface pool and given back when the layer is out of date
+    """
+
+    def __init__(self, run, screen_rect, background=None):
+        pool = SpriteItem.surface_pool
+        if background is not None:
+            # bottom of the display, so include the background and make the layer opaque
+            self.position = screen_rect.copy()
+            self.surface = pool.borrow(self.position.size, 0)
+            self.surface.fill(background)
+        else:
+            self.position = run[0][2].unionall([item[2] for item in run[1:]])
+            self.position = self.position.clip(screen_rect)
+            self.surface = pool.borrow(self.position.size)
+            self.surface.fill((0, 0, 0, 0))
+        for sprite, surface, position, opacity in run:
+            paint(self.surface, surface, position.move(-self.position.x, -self.position.y), opacity)
+
+    def release(self):
+        SpriteItem.surface_pool.release(self.surface)
+        self.surface = None
+
+    @staticmethod
+    def separate(run):
+        """
+        True if no two sprites in the run overlap and the layer would not be mostly empty
+        """
+        positions = []
+        area = 0
+        for sprite, surface, position, opacity in run:
+            if position.collidelist(positions) >= 0:
+                return False
+            positions.append(position)
+            area += position.width * position.height
+        bounds = positions[0].unionall(positions[1:])
+        return bounds.width * bounds.height <= area * 2
+
+# *************************************************************************************************
+#
+#    ########   #######  ########    ###    ######## ####  #######  ##    ##    ###    ######## ##          ###     ######
+#    ##     ## ##     ##    ##      ## ##      ##     ##  ##     ## ###   ##   ## ##      ##    ##         ## ##   ##    ##
+#    ##     ## ##     ##    ##     ##   ##     ##     ##  ##     ## ####  ##  ##   ##     ##    ##        ##   ##  ##
+#    ########  ##     ##    ##    ##     ##    ##     ##  ##     ## ## ## ## ##     ##    ##    ##       ##     ##  ######
+#    ##   ##   ##     ##    ##    #########    ##     ##  ##     ## ##  #### #########    ##    ##       #########       ##
+#    ##    ##  ##     ##    ##    ##     ##    ##     ##  ##     ## ##   ### ##     ##    ##    ##       ##     ## ##    ##
+#    ##     ##  #######     ##    ##     ##    ##    ####  #######  ##    ## ##     ##    ##    ######## ##     ##  ######
+#
+# **************************************************************************************************
+
+
+class RotationAtlas:
+    """
+    A sprite rendered at every step round the circle in one go, the first time it is needed, so
+    that a sprite that keeps on turning only has to look up each frame. Only used (see
+    SpriteItem.spinning) when nothing but the rotation is changing, and dropped as soon as the
+    sprite stops turning or anything else about it changes. All the atlases together are kept
+    under ROTATION_ATLAS_MB, a sprite that would not fit is rendered as usual
+    """
+    step = ROTATION_ATLAS_STEP  # degrees between renderings, 0 turns atlases off (--atlas)
+    total_bytes = 0
+
+    def __init__(self, sprite, state):
+        self.state = self.without_rotation(state)
+        count = int(round(360 / RotationAtlas.step))
+        self.surfaces = [sprite.render(state[:3] + (number * 360 / count,) + state[4:])
+                         for number in range(count)]
+        size = sum(surface_bytes(surface) for surface in self.surfaces)
+        RotationAtlas.total_bytes += size
+        # give the memory back to the budget when the atlas is dropped
+        weakref.finalize(self, RotationAtlas.forget, size)
+
+    @staticmethod
+    def forget(size):
+        RotationAtlas.total_bytes -= size
+
+    @staticmethod
+    def without_rotation(state):
+        return state[:3] + state[4:]
+
+    @staticmethod
+    def fits(state):
+        """
+        True if there is room for an atlas of the sprite, allowing for every rendering being
+        as big as the sprite turned 45 degrees
+        """
+        window, width, height = state[:3]
+        side = math.ceil(math.hypot(width, height))
+        count = int(round(360 / RotationAtlas.step))
+        return RotationAtlas.total_bytes + count * side * side * 4 <= ROTATION_ATLAS_MB * 1024 * 1024
+
+    def get(self, rotation):
+        count = len(self.surfaces)
+        return self.surfaces[int(round(rotation * count / 360)) % count]
+
 # *************************************************************************************************
 #
 #     ######  ########  ########  #### ######## ######## #### ######## ######## ##     ##
@@ -122,6 +555,8 @@ class SpriteList:
 
 class SpriteItem:
     globalData = None
+    render_cache = RenderCache(RENDER_CACHE_MB * 1024 * 1024)
+    surface_pool = SurfacePool(SURFACE_POOL_MB * 1024 * 1024, SURFACE_POOL_QUANTUM)
 
 # *************************************************************************************************
 #
@@ -135,128 +570,110 @@ class SpriteItem:
 #
 # **************************************************************************************************
     class Adjustable:
+        """
+        A value that can change over time. The state itself lives in the shared AnimationStore
+        so that every Adjustable is advanced in one batch, this is just a handle onto its slot.
+        The owner (if any) is told whenever the value changes, see SpriteItem.invalidate
+        """
+        store = AnimationStore()
 
-        def __init__(self, in_value, min_value=float('-inf'), max_value=float('inf')):
-            # set limits, if given
-            self.lower_limit = min_value
-            self.upper_limit = max_value
-            # data for constant motion
-            self.current_value = in_value
-            self.target_value = in_value
-            self.delta_value = 0.0
-            # data for acceleration
-            self.time_to_run = 0.0
-            self.time_counter = 0.0
-            self.accel_value = 0.0
-            self.initial_value = 0.0
-            self.changed = False
+        def __init__(self, in_value, min_value=float('-inf'), max_value=float('inf'), owner=None):
+            self.owner = owner
+            self.slot = self.store.allocate(self, in_value, min_value, max_value)
+            # hand the slot back when this handle is no longer used
+            weakref.finalize(self, self.store.release, self.slot)
 
         def value(self):
-            return self.current_value
+            return float(self.store.current[self.slot])
+
+        def is_active(self):
+            return self.slot in self.store.active
+
+        def set_frozen(self, frozen):
+            self.store.freeze(self.slot, frozen, Timer.seconds())
 
         def get_delta(self):
             """
             return rate of change in pixels per second
             """
-            return self.delta_value * FRAMERATE
+            return self.store.speed(self.slot, Timer.seconds())
 
         def set_delta(self, delta, rate):
             """
             set rate of change in pixels per second
             accelerating or slowing if rate is non-zero
             """
-            if rate <= 0:
-                self.delta_value = delta / FRAMERATE
-                return
-            # need to accelerate to the new value in rate seconds
-            self.time_to_run = rate
-            self.time_counter = 0.0
-            self.initial_value = self.get_delta()
-            self.accel_value = (delta - self.get_delta()) / rate
-            self.changed = True
+            self.store.set_speed(self.slot, delta, rate, Timer.seconds())
 
         def get_accel(self):
-            return self.accel_value * FRAMERATE
+            return float(self.store.accel[self.slot])
 
-        def set_target_value(self, target_value, seconds=0):
+        def set_target_value(self, target_value, seconds=0, easing=EASE_LINEAR):
             if target_value is None:
                 return
-            target_value = target_value if target_value > self.lower_limit else self.lower_limit
-            target_value = target_value if target_value < self.upper_limit else self.upper_limit
-            self.target_value = target_value
-            if seconds is None or seconds < 0.001:
-                self.current_value = target_value
-                self.delta_value = 0
-            else:
-                self.delta_value = (target_value - self.current_value) / (seconds * FRAMERATE)
-            self.changed = True
-
-        def update_value(self):
-            try:
-                if abs(self.current_value - self.target_value) > abs(self.delta_value):
-                    self.changed = True
-                    self.current_value += self.delta_value
-                    # accelerate or slow down to the target value?
-                    if self.time_counter < self.time_to_run:
-                        self.delta_value = (self.initial_value + (self.accel_value * self.time_counter)) / FRAMERATE
-                        self.time_counter += 1 / FRAMERATE
-                    else:
-                        self.time_to_run = 0
-                else:
-                    self.current_value = self.target_value
-                    self.delta_value = 0
-                    self.accel_value = 0
-            except TypeError as e:
-                print(f"from {self.target_value} to {self.current_value} by {self.delta_value}")
-            return_value = self.changed
-            self.changed = False
-            return return_value
+            store, slot = self.store, self.slot
+            target_value = max(store.lower[slot], min(store.upper[slot], target_value))
+            store.tween(slot, target_value, seconds, Timer.seconds(), easing)
 
     # End inner class
 
     def __init__(self, itag, stag, scene, centre_x, centre_y, width=None, height=None, depth=0):
+        # how many of our Adjustables are changing, kept up to date by the AnimationStore
+        self.active_adjustables = 0
         self.tag = stag
         self.scene = scene
         self.depth = depth
-        self.x = self.Adjustable(centre_x)
-        self.y = self.Adjustable(centre_y)
-        self.image = SpriteItem.globalData.images[itag]
+        self.x = self.Adjustable(centre_x, owner=self)
+        self.y = self.Adjustable(centre_y, owner=self)
+        self.image_tag = itag
+        # keeps the image loaded until the sprite is removed
+        self.image = SpriteItem.globalData.images.use(itag, self)
         if self.image.image_rect is None:
             print("No image rect %s" % stag)
+            SpriteItem.globalData.images.release(itag, self)
             return
         w = width or self.image.image_rect.width
         h = height or self.image.image_rect.height
-        self.w = self.Adjustable(w)
-        self.h = self.Adjustable(h)
-        self.rot = self.Adjustable(0, -360, 360)
-        self.alpha = self.Adjustable(0, 0, 100)
-        self.dark = self.Adjustable(0, 0, 100)
-        self.light = self.Adjustable(0, 0, 100)
-        self.blur = self.Adjustable(0, 0, 100)
+        self.w = self.Adjustable(w, owner=self)
+        self.h = self.Adjustable(h, owner=self)
+        self.rot = self.Adjustable(0, -360, 360, owner=self)
+        self.alpha = self.Adjustable(0, 0, 100, owner=self)
+        self.dark = self.Adjustable(0, 0, 100, owner=self)
+        self.light = self.Adjustable(0, 0, 100, owner=self)
+        self.blur = self.Adjustable(0, 0, 100, owner=self)
         self.visible = True
         self.visibilityTimer = None
         self.paused = False
-        self.animation_rate = self.Adjustable(0)
+        self.animation_rate = self.Adjustable(0, owner=self)
         self.last_frame_millis = Timer.millis()
         self.windowed = False
-        self.ix = self.Adjustable(0)
-        self.iy = self.Adjustable(0)
-        self.ih = self.Adjustable(0)
-        self.iw = self.Adjustable(0)
+        self.ix = self.Adjustable(0, owner=self)
+        self.iy = self.Adjustable(0, owner=self)
+        self.ih = self.Adjustable(0, owner=self)
+        self.iw = self.Adjustable(0, owner=self)
+        # re-render, re-position or re-fade on the next display
         self.updated = True
+        self.moved = True
+        self.faded = True
+        self.opacity = 255
         self.previous = None
         self.transition = None
         self.group = None
+        self.group_version = None  # of the group image last rendered, if this shows a group
+        self.group_changed = False  # the group image was repainted this frame
+        self.atlas = None  # RotationAtlas, while spinning
 
     def reposition(self, centre_x, centre_y, width=None, height=None, depth=None):
-        self.x = self.Adjustable(centre_x)
-        self.y = self.Adjustable(centre_y)
+        self.x = self.Adjustable(centre_x, owner=self)
+        self.y = self.Adjustable(centre_y, owner=self)
         if width is not None:
-            self.w = self.Adjustable(width)
+            self.w = self.Adjustable(width, owner=self)
         if height is not None:
-            self.h = self.Adjustable(height)
+            self.h = self.Adjustable(height, owner=self)
         if depth is not None:
             self.depth = depth
+        self.updated = True
+        self.set_paused(self.paused)
 
     def move_in_time(self, new_x, new_y, seconds, relative):
         if relative:
@@ -345,11 +762,10 @@ class SpriteItem:
         pass
 
     def set_visibility_duration(self, seconds):
-        self.visibilityTimer = self.Adjustable(0)
-        # set the timer to a per-second count
-        self.visibilityTimer.set_target_value(seconds * FRAMERATE)
-        # Now count it down to zero
+        # count down the seconds to zero
+        self.visibilityTimer = self.Adjustable(seconds, owner=self)
         self.visibilityTimer.set_target_value(0, seconds)
+        self.visibilityTimer.set_frozen(self.paused)
 
     def zoom_to(self, width, height, seconds):
         if not self.windowed:
@@ -373,88 +789,254 @@ class SpriteItem:
         self.image.move_to_frame(frame_num)
         self.updated = True
 
-    def update(self):
+    def update(self, viewport=None):
+        # Adjustables have already been stepped by SpriteList, see AnimationStore.step,
+        # so this is only needed (and only called) if is_animated
         if self.paused:
             return
-        for name, value in vars(self).items():
-            if value.__class__.__name__ == "Adjustable":
-                if value.update_value():
-                    self.updated = True
+        if self.image.__class__.__name__ == "Movie" and self.group is None and viewport is not None \
+                and not (self.visible and self.bounds().colliderect(viewport)):
+            # no one can see it, so let the movie stop decoding until it is back
+            return
         if self.image.__class__.__name__ == "GroupImage":
             self.image.next_frame()
+            self.group_changed = self.image.version != self.group_version
+            if self.group_changed:
+                # the group has been repainted
+                self.group_version = self.image.version
+                self.updated = True
         elif self.animation_rate.value() > 0:
             if Timer.millis() - self.last_frame_millis > self.animation_rate.value() * 1000:
                 self.last_frame_millis = Timer.millis()
                 self.image.next_frame()
                 self.updated = True
 
-    def display(self, screen):
+    def is_animated(self):
+        return self.image.__class__.__name__ == "GroupImage" or self.animation_rate.value() > 0
+
+    def invalidate(self, adjustable):
+        """
+        Work out how much of the rendering has to be redone after an Adjustable has changed
+        """
+        if adjustable is self.x or adjustable is self.y:
+            self.moved = True
+        elif adjustable is self.alpha:
+            self.faded = True
+        elif adjustable is self.animation_rate:
+            SpriteItem.globalData.sprites.set_animated(self)
+        elif adjustable is not self.visibilityTimer:
+            self.updated = True
+
+    def is_static(self):
+        """
+        True if nothing about the sprite is changing, so it can be flattened into a layer
+        """
+        if self.paused:
+            return True
+        if self.visibilityTimer is not None or self.animation_rate.value() > 0:
+            return False
+        if self.image.frame_key() is None:
+            return False
+        return self.active_adjustables == 0
+
+    def spinning(self):
+        """
+        True if the sprite is turning and nothing else about how it is rendered is changing
+        """
+        if RotationAtlas.step <= 0 or self.paused or not self.rot.is_active() or self.is_animated():
+            return False
+        if self.image.frame_key() is None:
+            return False
+        changing = [self.w, self.h, self.light, self.dark, self.blur, self.ix, self.iy, self.iw, self.ih]
+        return not any(adjustable.is_active() for adjustable in changing)
+
+    def adjustables(self):
+        return [value for value in vars(self).values() if isinstance(value, SpriteItem.Adjustable)]
+
+    def set_paused(self, paused):
+        """
+        Freeze (or unfreeze) all the changing values of this sprite
+        """
+        self.paused = paused
+        for adjustable in self.adjustables():
+            adjustable.set_frozen(paused)
+
+    def render_state(self):
+        """
+        Quantized description of everything that affects the rendered surface
+        """
+        if self.windowed:
+            window_width = self.iw.value()
+            window_height = self.ih.value()
+            window = tuple(pygame.Rect(self.ix.value() - window_width / 2,
+                                       self.iy.value() - window_height / 2,
+                                       window_width, window_height))
+        else:
+            window = None
+        rotation = round(self.rot.value() / ROTATION_QUANTUM) * ROTATION_QUANTUM
+        lightness = int(255 * self.light.value() / 100)
+        darkness = int(255 - (255 * self.dark.value() / 100))
+        bluriness = int(self.blur.value() / 4 / BLUR_QUANTUM) * BLUR_QUANTUM
+        return window, int(self.w.value()), int(self.h.value()), rotation, lightness, darkness, bluriness
+
+    def rotated(self, state):
+        """
+        The rendered surface from the rotation atlas, making the atlas first if the sprite has
+        just started turning far enough to be worth it. None if the sprite is to be rendered as usual
+        """
+        if not self.spinning():
+            self.atlas = None
+            return None
+        if self.atlas is not None and self.atlas.state != RotationAtlas.without_rotation(state):
+            self.atlas = None
+        if self.atlas is None:
+            store, slot = self.rot.store, self.rot.slot
+            if abs(store.target[slot] - store.current[slot]) < ROTATION_ATLAS_MIN_TURN:
+                return None
+            if not RotationAtlas.fits(state):
+                return None
+            started = Profiler.start()
+            self.atlas = RotationAtlas(self, state)
+            Profiler.stop("atlas %s" % self.tag, started)
+        return self.atlas.get(state[3])
+
+    def render(self, state):
+        window, width, height, rotation, lightness, darkness, bluriness = state
+        if bluriness > 0:
+            return self.render_blur(state)
+        pool = SpriteItem.surface_pool
+        # Get the source image onto surface, everything but the result is borrowed from the pool
+        if window is not None:
+            image_rect = pygame.Rect(window)
+        else:
+            image_rect = self.image.image_rect
+        # a solid image stays solid (and quicker to draw) unless turning it or a window hanging
+        # over its edge leaves transparent corners
+        solid = not self.image.surface.get_flags() & pygame.SRCALPHA and rotation == 0 \
+            and self.image.surface.get_rect().contains(image_rect)
+        source = pool.borrow(image_rect.size, 0 if solid else pygame.SRCALPHA)
+        if not solid:
+            source.fill((0, 0, 0, 0))
+        source.blit(self.image.surface, (0, 0), image_rect)
+        # Scale surface to the required size on screen
+        if rotation != 0:
+            # If rotated, turn the image (this changes the width and height)
+            scaled = pygame.transform.scale(source, (width, height), pool.borrow((width, height)))
+            surface = pygame.transform.rotate(scaled, rotation * -1)
+            pool.release(scaled)
+        else:
+            surface = pygame.transform.scale(source, (width, height))
+        pool.release(source)
+        # Blended fills change the colours in place and leave the alpha alone
+        if lightness > 0:
+            # Make sprite lighter
+            surface.fill((lightness, lightness, lightness, 0), special_flags=pygame.BLEND_RGB_MAX)
+        if darkness < 255:
+            # Make sprite darker
+            surface.fill((darkness, darkness, darkness, 0), special_flags=pygame.BLEND_RGB_MIN)
+        # Transparency of the whole sprite is not part of the surface, it is applied when painted
+        return surface
+
+    def render_blur(self, state):
+        """
+        Blur the sprite as rendered without blur, which is cached as well so that a changing blur
+        only costs the blur itself. Big blurs are done on a copy scaled down until the radius is
+        under 2 * BLUR_FULL_RADIUS and then scaled back up, which looks much the same
+        """
+        pool = SpriteItem.surface_pool
+        bluriness = state[-1]
+        sharp_state = state[:-1] + (0,)
+        frame_key = self.image.frame_key()
+        if frame_key is None:
+            surface = self.render(sharp_state)
+        else:
+            sharp_key = (frame_key,) + sharp_state
+            sharp = SpriteItem.render_cache.get(sharp_key)
+            if sharp is None:
+                sharp = SpriteItem.render_cache.put(sharp_key, self.render(sharp_state))
+            # cached surfaces are shared, so blur a copy
+            surface = sharp.copy()
+        size = surface.get_size()
+        if size[0] == 0 or size[1] == 0:
+            return surface
+        flags = surface.get_flags() & pygame.SRCALPHA
+        scale = 1
+        while bluriness / (scale * 2) >= BLUR_FULL_RADIUS:
+            scale *= 2
+        if scale > 1:
+            small_size = (max(1, math.ceil(size[0] / scale)), max(1, math.ceil(size[1] / scale)))
+            small = pygame.transform.smoothscale(surface, small_size, pool.borrow(small_size, flags))
+            blurred = pygame.transform.gaussian_blur(small, bluriness // scale, True, pool.borrow(small_size, flags))
+            tmp = pygame.transform.smoothscale(blurred, size, pool.borrow(size, flags))
+            pool.release(small)
+            pool.release(blurred)
+        else:
+            tmp = pygame.transform.gaussian_blur(surface, bluriness, True, pool.borrow(size, flags))
+        surface.blit(tmp, (0, 0))
+        pool.release(tmp)
+        return surface
+
+    def bounds(self):
+        """
+        The area of the screen the sprite will cover, worked out without rendering it.
+        Rotation makes the rendered surface bigger but it is still placed from the top left
+        """
+        width = self.w.value()
+        height = self.h.value()
+        angle = math.radians(self.rot.value())
+        cos = abs(math.cos(angle))
+        sin = abs(math.sin(angle))
+        # a pixel spare all round for rounding
+        return pygame.Rect(self.x.value() - (width / 2) - 1, self.y.value() - (height / 2) - 1,
+                           width * cos + height * sin + 2, width * sin + height * cos + 2)
+
+    def prepare(self, viewport=None):
+        """
+        Bring the rendered surface up to date, returns the surface, its screen position and
+        the opacity to paint it with, or None if the sprite is not visible (which includes being
+        entirely outside the viewport, if given)
+        """
         if self.visibilityTimer is not None:
             if self.visibilityTimer.value() <= 0:
                 self.visible = not self.visible
                 self.visibilityTimer = None
         if not self.visible:
-            return
-        if self.updated:
-            # Get the source image onto surface
-            if self.windowed:
-                target_width = self.iw.value()
-                target_height = self.ih.value()
-                surface = pygame.Surface((int(self.iw.value()), int(self.ih.value())), pygame.SRCALPHA)
-                image_rect = pygame.Rect(self.ix.value() - target_width / 2,
-                                         self.iy.value() - target_height / 2,
-                                         target_width, target_height)
-            else:
-                target_width = self.w.value()
-                target_height = self.h.value()
-                surface = pygame.Surface((int(self.image.image_rect.width), int(self.image.image_rect.height)), pygame.SRCALPHA)
-                image_rect = self.image.image_rect
-            surface.blit(self.image.surface, (0, 0), image_rect)
-            # Scale surface to the required size on screen
-            surface = pygame.transform.scale(surface, (self.w.value(), self.h.value()))
-            # If rotated, turn the image and re-calculate width and height
-            if self.rot.value() != 0:
-                surface = pygame.transform.rotate(surface, self.rot.value() * -1)
-                new_rect = surface.get_rect(center=(target_width / 2, target_height / 2))
-                target_height = new_rect.height
-                target_width = new_rect.width
-            if self.light.value() > 0:
-                # Make sprite darker
-                tmp = pygame.Surface((int(target_width), int(target_height)), pygame.SRCALPHA)
-                lightness = int(255 * self.light.value() / 100)
-                tmp.fill((lightness, lightness, lightness))
-                surface.blit(tmp, (0, 0), special_flags=pygame.BLEND_MAX)
-            # If the whole sprite has transparency, add that to the existing alpha channel
-            if self.dark.value() > 0:
-                # Make sprite darker
-                tmp = pygame.Surface((int(target_width), int(target_height)), pygame.SRCALPHA)
-                darkness = int(255 - (255 * self.dark.value() / 100))
-                tmp.fill((darkness, darkness, darkness))
-                surface.blit(tmp, (0, 0), special_flags=pygame.BLEND_MIN)
-            if self.blur.value() > 0:
-                tmp = pygame.Surface((int(target_width), int(target_height)), pygame.SRCALPHA)
-                bluriness = int(self.blur.value() / 4)
-                pygame.transform.gaussian_blur(surface, bluriness, True, tmp)
-                surface.blit(tmp, (0, 0))
-            # If the whole sprite has transparency, add that to the existing alpha channel
-            if self.alpha.value() > 0:
-                # convert transparency 0->100 to alpha 255->0
-                tmp = pygame.Surface((int(target_width), int(target_height)), pygame.SRCALPHA)
-                tmp.fill((255, 255, 255, int(255 - (255 * self.alpha.value() / 100))))
-                surface.blit(tmp, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
-            position = pygame.Rect(self.x.value() - (self.w.value() / 2),
-                                   self.y.value() - (self.h.value() / 2),
-                                   target_width, target_height)
+            return None
+        if viewport is not None and not self.bounds().colliderect(viewport):
+            # the flags stay set, so it is brought up to date when it comes back into view
+            return None
+        if self.updated or self.previous is None:
+            # Size, rotation, frame or effects have changed, so re-render
+            state = self.render_state()
+            surface = self.rotated(state)
+            if surface is None:
+                frame_key = self.image.frame_key()
+                key = None if frame_key is None else (frame_key,) + state
+                surface = SpriteItem.render_cache.get(key)
+            if surface is None:
+                started = Profiler.start()
+                surface = SpriteItem.render_cache.put(key, self.render(state))
+                Profiler.stop("render %s" % self.tag, started)
             # if transition is not None:
             #     transition.between(self.previous, (surface,position))
-            self.previous = surface, position
+            self.previous = surface, None
             self.updated = False
-        elif self.transition is not None:
-            surface, position = self.previous
-            # surface, position = transition.update()
-        else:
-            surface, position = self.previous
-        screen.blit(surface, position)
+            self.moved = True
+        # elif self.transition is not None:
+        #     surface, position = transition.update()
+        surface, position = self.previous
+        if self.moved:
+            # Same surface, just painted somewhere else
+            position = pygame.Rect(self.x.value() - (self.w.value() / 2),
+                                   self.y.value() - (self.h.value() / 2),
+                                   surface.get_width(), surface.get_height())
+            self.previous = surface, position
+            self.moved = False
+        if self.faded:
+            # convert transparency 0->100 to alpha 255->0
+            self.opacity = int(255 - (255 * self.alpha.value() / 100))
+            self.faded = False
+        return surface, position, self.opacity
 
     def dump(self):
         return "%s at %f,%f,%d" % (self.tag,
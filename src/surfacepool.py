@@ -0,0 +1,94 @@
+import math
+
+import pygame
+
+from rendercache import surface_bytes
+
+# *************************************************************************************************
+#
+#     ######  ##     ## ########  ########    ###     ######  ######## ########   #######   #######  ##
+#    ##    ## ##     ## ##     ## ##         ## ##   ##    ## ##       ##     ## ##     ## ##     ## ##
+#    ##       ##     ## ##     ## ##        ##   ##  ##       ##       ##     ## ##     ## ##     ## ##
+#     ######  ##     ## ########  ######   ##     ## ##       ######   ########  ##     ## ##     ## ##
+#          ## ##     ## ##   ##   ##       ######### ##       ##       ##        ##     ## ##     ## ##
+#    ##    ## ##     ## ##    ##  ##       ##     ## ##    ## ##       ##        ##     ## ##     ## ##
+#     ######   #######  ##     ## ##       ##     ##  ######  ######## ##         #######   #######  ########
+#
+# **************************************************************************************************
+
+
+class SurfacePool:
+    """
+    Surfaces that are only needed while something is being rendered are borrowed from here and
+    given back afterwards, rather than allocated and freed each time. Sizes are rounded up to
+    SURFACE_POOL_QUANTUM so that slightly different sizes share a bucket, the borrower gets a
+    subsurface of exactly the size asked for (a new one each time, so nothing set on it by the
+    last borrower, like its alpha, carries over). The contents are not cleared.
+    Spare surfaces are kept up to a byte budget, any more are left for the garbage collector.
+    """
+
+    def __init__(self, max_bytes, quantum):
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.spare = {}  # (width, height, flags) -> list of surfaces
+        self.borrowed = set()
+        self.spare_bytes = 0
+        self.borrowed_bytes = 0
+        self.peak_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def bucket(self, size, flags):
+        width, height = size
+        return (max(1, math.ceil(width / self.quantum)) * self.quantum,
+                max(1, math.ceil(height / self.quantum)) * self.quantum, flags)
+
+    def borrow(self, size, flags=pygame.SRCALPHA):
+        size = (max(0, int(size[0])), max(0, int(size[1])))
+        key = self.bucket(size, flags)
+        spare = self.spare.get(key)
+        if spare:
+            surface = spare.pop()
+            self.spare_bytes -= surface_bytes(surface)
+            self.hits += 1
+        else:
+            surface = pygame.Surface(key[:2], flags)
+            self.misses += 1
+        self.borrowed.add(surface)
+        self.borrowed_bytes += surface_bytes(surface)
+        self.peak_bytes = max(self.peak_bytes, self.borrowed_bytes + self.spare_bytes)
+        return surface.subsurface((0, 0) + size)
+
+    def release(self, surface):
+        """
+        Give back a surface from borrow, it must not be used again afterwards
+        """
+        if surface is None:
+            return
+        surface = surface.get_parent() or surface
+        if surface not in self.borrowed:
+            return
+        self.borrowed.remove(surface)
+        size = surface_bytes(surface)
+        self.borrowed_bytes -= size
+        if self.spare_bytes + size > self.max_bytes:
+            return
+        key = surface.get_size() + (surface.get_flags() & pygame.SRCALPHA,)
+        self.spare.setdefault(key, []).append(surface)
+        self.spare_bytes += size
+
+    def clear(self):
+        self.spare.clear()
+        self.spare_bytes = 0
+
+    def stats(self):
+        borrows = self.hits + self.misses
+        return {"borrows": borrows, "hit_rate": round(100 * self.hits / borrows, 1) if borrows > 0 else 0,
+                "borrowed_bytes": self.borrowed_bytes, "spare_bytes": self.spare_bytes,
+                "peak_bytes": self.peak_bytes}
+
+    def dump(self):
+        stats = self.stats()
+        print("Surface pool: %d borrows, %.1f%% from spares, %d bytes borrowed, %d spare, %d at peak" %
+              (stats["borrows"], stats["hit_rate"], stats["borrowed_bytes"], stats["spare_bytes"],
+               stats["peak_bytes"]))
@@ -5,6 +5,77 @@ from math import floor
 import wordtypes
 from defaults import *
 
+# *************************************************************************************************
+#
+#     ######  ##        #######   ######  ##    ##
+#    ##    ## ##       ##     ## ##    ## ##   ##
+#    ##       ##       ##     ## ##       ##  ##
+#    ##       ##       ##     ## ##       #####
+#    ##       ##       ##     ## ##       ##  ##
+#    ##    ## ##       ##     ## ##    ## ##   ##
+#     ######  ########  #######   ######  ##    ##
+#
+# **************************************************************************************************
+
+
+class Clock:
+    """
+    Every reading of the time (timers, triggers, time of day variables, animations) comes from
+    here, so that scripts can be run faster than real time. There are three modes:
+    real - the time is the time
+    scaled - time passes speed times faster (or slower) than real time
+    stepped - time only moves on when step is called, the main loop steps one frame at a time
+    """
+    mode = "real"
+    speed = 1.0
+    base_real = time.time()  # the real time when the mode was last changed...
+    base_time = base_real  # ...and the clock time at that moment
+
+    @staticmethod
+    def time():
+        """
+        Seconds since the epoch, according to this clock
+        """
+        if Clock.mode == "stepped":
+            return Clock.base_time
+        return Clock.base_time + (time.time() - Clock.base_real) * Clock.speed
+
+    @staticmethod
+    def now():
+        return datetime.fromtimestamp(Clock.time())
+
+    @staticmethod
+    def set_mode(mode, speed=1.0):
+        if mode not in ["real", "scaled", "stepped"]:
+            print("Unknown clock mode %s" % mode)
+            return
+        Clock.base_time = Clock.time()
+        Clock.base_real = time.time()
+        Clock.mode = mode
+        Clock.speed = speed if mode == "scaled" else 1.0
+
+    @staticmethod
+    def set_time_of_day(time_string):
+        """
+        Move the clock to the given time (hh:mm:ss) today, it carries on from there
+        """
+        time_of_day = TimeOfDay(time_string)
+        now = Clock.now()
+        start = now.replace(hour=time_of_day.hour, minute=time_of_day.minute,
+                            second=time_of_day.second, microsecond=0)
+        Clock.base_time += (start - now).total_seconds()
+
+    @staticmethod
+    def step(seconds):
+        Clock.base_time += seconds
+
+    @staticmethod
+    def real_time(duration):
+        """
+        How long to wait in real time for duration (in any units) to pass on this clock
+        """
+        return duration / Clock.speed
+
 # *************************************************************************************************
 #
 #    ######## #### ##     ## ########  #######  ######## ########     ###    ##    ##
@@ -30,7 +101,7 @@ class TimeOfDay:
                 self.hour = int(parts[0])
             elif len(parts) == 2:  # assume hh:mm
                 self.hour = int(parts[0])
-                self.minutes = int(parts[1])
+                self.minute = int(parts[1])
             else:  # 3 or more, assume hh:mm:ss + ignore rest
                 self.hour = int(parts[0])
                 self.minute = int(parts[1])
@@ -89,7 +160,7 @@ class Duration:
     def __init__(self, time_string):
         # the small parts are strings, if you want a number use as_float
         self.total = 0
-        if len(time_string) == 0:
+        if time_string is None or len(time_string) == 0:
             return
         words = re.split(WORD_SPLIT, time_string.lower())
         if "same" in words:
@@ -208,7 +279,11 @@ class Timer:
 
     @staticmethod
     def millis():
-        return time.time() * 1000
+        return Clock.time() * 1000
+
+    @staticmethod
+    def seconds():
+        return Timer.millis() / 1000
 
     def reset(self):
         self.start_time = self.millis()
@@ -244,7 +319,7 @@ class Now(Timer):
         pass
 
     def update(self):
-        now = datetime.now()
+        now = Clock.now()
         self.hour = now.hour
         self.minute = now.minute
         self.second = now.second
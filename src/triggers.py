@@ -1,4 +1,5 @@
 # From standard libraries
+from datetime import timedelta
 
 import timing
 
@@ -54,6 +55,13 @@ class Trigger:
     def update(self, millis):
         pass
 
+    def next_deadline(self, millis):
+        """
+        The time (in millis) by which this trigger next needs to be checked, or None if it can
+        only be set off by input (which wakes the main loop anyway) or never again
+        """
+        return None
+
 
 # *************************************************************************************************
 #
@@ -162,6 +170,11 @@ class After(Trigger):
                 # Only triggers once
                 self.expired = True
 
+    def next_deadline(self, millis):
+        if self.expired:
+            return None
+        return self.timer.start_time + self.time_value.as_millis() + 1
+
 
 # *************************************************************************************************
 #
@@ -197,6 +210,19 @@ class AtTime(Trigger):
             if self.triggered:
                 self.expired = True  # only happens once
 
+    def next_deadline(self, millis):
+        if self.expired:
+            return None
+        now = timing.Clock.now()
+        if now.hour == self.time_value.hour and now.minute == self.time_value.minute:
+            # due now, or later this minute
+            return millis + max(0, self.time_value.second - now.second) * 1000
+        when = now.replace(hour=self.time_value.hour, minute=self.time_value.minute,
+                           second=self.time_value.second, microsecond=0)
+        if when < now:
+            when += timedelta(days=1)
+        return millis + (when - now).total_seconds() * 1000
+
 
 # *************************************************************************************************
 #
@@ -233,6 +259,10 @@ class EachTime(Trigger):
             # Only need to check this once per second
             self.next_update = millis + 1000
 
+    def next_deadline(self, millis):
+        # patterns only match whole seconds, so check at the start of the next one
+        return max(self.next_update, millis - (millis % 1000) + 1000)
+
 
 # *************************************************************************************************
 #
@@ -268,6 +298,9 @@ class Every(Trigger):
             if self.time_value.as_seconds() >= 1:
                 self.next_update = millis + self.time_value.as_millis()
 
+    def next_deadline(self, millis):
+        return max(self.next_update, self.timer.start_time + self.time_value.as_millis() + 1)
+
 
 # *************************************************************************************************
 #
@@ -335,6 +368,10 @@ class When(Trigger):
             self.triggered = True
             self.expired = True
 
+    def next_deadline(self, millis):
+        # the expression may depend on anything, so look again in a second
+        return None if self.expired else millis + 1000
+
 # *************************************************************************************************
 #
 #    ##      ## ##     ## #### ##       ########
@@ -363,3 +400,7 @@ class While(Trigger):
         self.expand()
         if self.variables.true_or_false(self.expanded):
             self.triggered = True
+
+    def next_deadline(self, millis):
+        # needs checking every frame
+        return millis
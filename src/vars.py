@@ -1,8 +1,8 @@
 import re
-from datetime import datetime
 
 import pygame
 
+import timing
 from defaults import *
 import random
 
@@ -37,7 +37,7 @@ class Variables:
         else:
             name = in_name
         value = None
-        now = datetime.now()
+        now = timing.Clock.now()
         # Built-ins first
         if name == "SECOND":
             value = now.second
@@ -75,7 +75,7 @@ class Variables:
             elif name.endswith("Y"):
                 value = y
         elif name == "FRAMERATE":
-            value = FRAMERATE
+            value = self.data.options["framerate"]
         elif name == "WIDTH":
             value = width
         elif name == "HEIGHT":